@@ -0,0 +1,176 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:     # Optional: without it only gzip variants are written
+    brotli = None
+
+try:
+    import sass
+except ImportError:     # Optional: without it the checked-in compiled CSS is bundled
+    sass = None
+
+# Bundles served in place of the individual files the page header and footer used to link
+BUNDLES = {
+    "bundle.css": ["vendor/bootstrap/css/bootstrap.min.css", "vendor/fontawesome-free/css/all.min.css",
+                   "css/clean-blog.min.css"],
+    "bundle.js": ["vendor/jquery/jquery.min.js", "vendor/bootstrap/js/bootstrap.bundle.min.js",
+                  "js/clean-blog.min.js"],
+}
+SCSS_SOURCES = {"css/clean-blog.min.css": "scss/clean-blog.scss"}
+COMPRESSIBLE = {".css", ".js", ".svg", ".ttf", ".eot", ".ico", ".json"}
+SKIPPED_DIRECTORIES = {"dist", "scss"}
+SKIPPED_EXTENSIONS = {".map"}
+ONE_YEAR = 365 * 24 * 60 * 60
+
+SOURCE_MAP_COMMENT = re.compile(r"/[*/]# sourceMappingURL=[^\n]*")
+CSS_COMMENT = re.compile(r"/\*(?!!).*?\*/", re.S)   # Keeps /*! license */ banners
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def minify_css(css):
+    """Strips comments and needless whitespace from a stylesheet."""
+    css = CSS_COMMENT.sub("", css)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};,>])\s*", r"\1", css).strip()
+
+
+class Assets:
+    """Fingerprints the static files, builds the CSS/JS bundles and serves them as immutable assets.
+
+    build() writes the bundles and gzip (and, when the brotli package is installed, brotli) variants into
+    static/dist, and a manifest mapping each static filename to a URL containing a hash of its content.
+    It runs from `flask build-assets` at deploy time; the app only loads the manifest, so starting a
+    worker never walks static/. Templates keep calling url_for('static', filename=...), which resolves
+    through the manifest, so a changed file gets a new URL and browsers can cache every asset for a year
+    without revalidating. Until the assets are built, the plain /static URLs are served instead.
+    """
+
+    def __init__(self, app=None):
+        self.static_folder = None
+        self.dist_folder = None
+        self.manifest = {}      # static filename -> fingerprinted name
+        self.files = {}         # fingerprinted name -> (folder key, path, encodings written)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.dist_folder = os.path.join(app.static_folder, "dist")
+        if not self._load():
+            app.logger.warning("No static asset manifest in %s; run `flask build-assets`", self.dist_folder)
+        app.add_url_rule("/assets/<path:filename>", "assets", self.serve)
+        app.jinja_env.globals["url_for"] = self.url_for
+        app.extensions["assets"] = self
+
+    def url_for(self, endpoint, **values):
+        """url_for for templates: static files resolve to their fingerprinted /assets URL when known."""
+        if endpoint == "static" and values.get("filename", "").lstrip("/") in self.manifest:
+            return url_for("assets", filename=self.manifest[values.pop("filename").lstrip("/")], **values)
+        return url_for(endpoint, **values)
+
+    def serve(self, filename):
+        """Serves a fingerprinted asset, precompressed when the browser accepts it, cached for good."""
+        if filename not in self.files:
+            return "Not Found", 404
+        folder, path, encodings = self.files[filename]
+        encoding = next((name for name in ("br", "gzip")
+                         if name in encodings and request.accept_encodings[name]), None)
+        directory = self.dist_folder if folder == "dist" or encoding else self.static_folder
+        response = send_from_directory(directory, path + {"br": ".br", "gzip": ".gz", None: ""}[encoding],
+                                       mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                                       max_age=ONE_YEAR, etag=False, conditional=True)
+        if encoding:
+            response.content_encoding = encoding
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def build(self):
+        """Fingerprints every static file, writes the bundles and compressed variants, then the manifest."""
+        self.manifest, self.files = {}, {}
+        for filename in self._sources():
+            with open(os.path.join(self.static_folder, filename), "rb") as source:
+                self._add("static", filename, filename, source.read())
+        for name, members in BUNDLES.items():
+            parts = [self._bundle_member(member) for member in members]
+            if name.endswith(".css"):
+                self._add("dist", name, name, "\n".join(parts).encode("utf-8"))
+            else:
+                self._add("dist", name, name, ";\n".join(parts).encode("utf-8"))
+        self._write("manifest.json", json.dumps({"manifest": self.manifest, "files": self.files}).encode("utf-8"))
+
+    def _bundle_member(self, filename):
+        path = os.path.join(self.static_folder, filename)
+        if filename in SCSS_SOURCES and sass is not None:
+            text = sass.compile(filename=os.path.join(self.static_folder, SCSS_SOURCES[filename]))
+        else:
+            with open(path, encoding="utf-8") as source:
+                text = source.read()
+        text = SOURCE_MAP_COMMENT.sub("", text)  # The maps are not shipped with the bundle
+        if not filename.endswith(".css"):
+            return text
+
+        def rewrite(match):  # Points url()s at the fingerprinted files, relative to the bundle's own URL
+            target, _, suffix = match.group(2).partition("?")
+            target, hash_sign, fragment = target.partition("#")
+            if target.startswith(("data:", "http:", "https:", "/")):
+                return match.group(0)
+            resolved = posixpath.normpath(posixpath.join(posixpath.dirname(filename), target))
+            if resolved not in self.manifest:
+                return match.group(0)
+            return "url(%s%s%s)" % (self.manifest[resolved], "?" + suffix if suffix else "",
+                                    hash_sign + fragment)
+
+        return minify_css(CSS_URL.sub(rewrite, text))
+
+    def _add(self, folder, filename, path, content):
+        stem, extension = os.path.splitext(filename)
+        hashed = f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}"
+        encodings = []
+        if folder == "dist":
+            self._write(path, content)
+        if extension in COMPRESSIBLE and len(content) > 1024:
+            self._write(path + ".gz", gzip.compress(content, compresslevel=9, mtime=0))
+            encodings.append("gzip")
+            if brotli is not None:
+                self._write(path + ".br", brotli.compress(content))
+                encodings.append("br")
+        self.manifest[filename] = hashed
+        self.files[hashed] = (folder, path, encodings)
+
+    def _write(self, path, content):
+        target = os.path.join(self.dist_folder, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temporary = f"{target}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as output:
+            output.write(content)
+        os.replace(temporary, target)   # Atomic, so workers building at the same time never serve half a file
+
+    def _sources(self):
+        for directory, subdirectories, filenames in os.walk(self.static_folder):
+            relative = os.path.relpath(directory, self.static_folder)
+            if relative == ".":
+                subdirectories[:] = [name for name in subdirectories if name not in SKIPPED_DIRECTORIES]
+            for name in sorted(filenames):
+                if os.path.splitext(name)[1] not in SKIPPED_EXTENSIONS:
+                    yield posixpath.normpath(posixpath.join(relative.replace(os.sep, "/"), name))
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.dist_folder, "manifest.json"), encoding="utf-8") as manifest:
+                data = json.load(manifest)
+        except (OSError, ValueError):
+            return False
+        self.manifest = data["manifest"]
+        self.files = {name: tuple(entry) for name, entry in data["files"].items()}
+        return True
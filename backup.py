@@ -0,0 +1,163 @@
+import gzip
+import json
+import os
+from datetime import date, datetime
+
+from sqlalchemy import Date, DateTime, func, insert, select, text
+
+FORMAT = "blog-export"
+FORMAT_VERSION = 1
+
+
+class BackupError(Exception):
+    """Raised when an export or import cannot start or the file is not a blog export."""
+
+
+def _checkpoint_path(path, action):
+    return f"{path}.{action}-checkpoint"
+
+
+def _read_checkpoint(path, action):
+    try:
+        with open(_checkpoint_path(path, action), encoding="utf-8") as checkpoint:
+            return json.load(checkpoint)
+    except FileNotFoundError:
+        return None
+
+
+def _clear_checkpoint(path, action):
+    if os.path.exists(_checkpoint_path(path, action)):
+        os.remove(_checkpoint_path(path, action))
+
+
+def _write_checkpoint(path, action, state):
+    target = _checkpoint_path(path, action)
+    with open(target + ".tmp", "w", encoding="utf-8") as checkpoint:
+        json.dump(state, checkpoint)
+    os.replace(target + ".tmp", target)
+
+
+def export_tables(session, tables, path, encoder, batch_size=1000, resume=False, progress=None):
+    """Streams every row of `tables` into a gzip-compressed JSON lines file at `path`.
+
+    Rows are read in primary key order, `batch_size` at a time, and each batch is written as its own gzip
+    member (concatenated members read back as one stream). After every batch the file offset is saved to a
+    checkpoint, so an interrupted export started again with `resume` cuts off the half-written batch and
+    carries on. Memory use does not depend on the size of the tables. Returns the rows written per table.
+    """
+    checkpoint = _read_checkpoint(path, "export") if resume else None
+    if resume and checkpoint is None:
+        raise BackupError(f"There is no interrupted export of {path} to resume.")
+    encode = encoder(separators=(",", ":"), ensure_ascii=False).encode
+    counts = dict(checkpoint["counts"]) if checkpoint else {}
+    with open(path, "r+b" if checkpoint else "wb") as output:
+        if checkpoint:
+            output.truncate(checkpoint["offset"])
+            output.seek(checkpoint["offset"])
+        else:
+            header = {"format": FORMAT, "version": FORMAT_VERSION, "tables": [table.name for table in tables]}
+            output.write(gzip.compress((encode(header) + "\n").encode("utf-8"), mtime=0))
+        for table in tables:
+            if checkpoint and table.name in checkpoint["done"]:
+                continue
+            last_id = checkpoint["last_id"] if checkpoint and checkpoint["table"] == table.name else None
+            counts.setdefault(table.name, 0)
+            while True:
+                query = select(table).order_by(table.c.id).limit(batch_size)
+                if last_id is not None:
+                    query = query.where(table.c.id > last_id)
+                rows = session.execute(query).mappings().all()
+                if not rows:
+                    break
+                lines = "".join(encode({"table": table.name, "row": dict(row)}) + "\n" for row in rows)
+                output.write(gzip.compress(lines.encode("utf-8"), compresslevel=6, mtime=0))
+                output.flush()
+                last_id = rows[-1]["id"]
+                counts[table.name] += len(rows)
+                session.rollback()  # Ends the read transaction so no snapshot is held between batches
+                done = [name for name in counts if name != table.name]
+                _write_checkpoint(path, "export", dict(offset=output.tell(), table=table.name, last_id=last_id,
+                                                       done=done, counts=counts))
+                if progress is not None:
+                    progress(table.name, counts[table.name])
+    _clear_checkpoint(path, "export")
+    return counts
+
+
+def _row_converter(table):
+    """Turns the ISO strings of a JSON row back into the dates its table expects, dropping unknown columns."""
+    dates = {column.name: (datetime.fromisoformat if isinstance(column.type, DateTime) else date.fromisoformat)
+             for column in table.columns if isinstance(column.type, (Date, DateTime))}
+    names = set(table.columns.keys())
+
+    def convert(row):
+        return {name: dates[name](value) if name in dates and value is not None else value
+                for name, value in row.items() if name in names}
+    return convert
+
+
+def import_tables(session, tables, path, batch_size=1000, resume=False, progress=None):
+    """Loads a file written by export_tables into `tables`, keeping the exported primary keys.
+
+    The file is streamed, and rows are inserted with one executemany INSERT per batch of `batch_size`, each
+    batch in its own transaction, after which the last imported id is saved to a checkpoint. An interrupted
+    import started again with `resume` skips the rows that were already committed. Returns the rows
+    imported per table.
+    """
+    checkpoint = _read_checkpoint(path, "import")
+    if checkpoint is not None and not resume:
+        raise BackupError(f"An import of {path} was interrupted; run it again with --resume to carry on.")
+    if resume and checkpoint is None:
+        raise BackupError(f"There is no interrupted import of {path} to resume.")
+    if checkpoint is None:
+        for table in tables:
+            if session.scalar(select(func.count()).select_from(table)):
+                raise BackupError(f"The {table.name} table is not empty; import into an empty database.")
+    by_name = {table.name: table for table in tables}
+    converters = {table.name: _row_converter(table) for table in tables}
+    done = set(checkpoint["done"]) if checkpoint else set()
+    counts = dict(checkpoint["counts"]) if checkpoint else {}
+    skip_through = (checkpoint["table"], checkpoint["last_id"]) if checkpoint else None
+    batch, batch_table = [], None
+
+    def flush():
+        session.execute(insert(by_name[batch_table]), batch)
+        session.commit()
+        counts[batch_table] = counts.get(batch_table, 0) + len(batch)
+        _write_checkpoint(path, "import", dict(table=batch_table, last_id=batch[-1]["id"],
+                                               done=sorted(done), counts=counts))
+        if progress is not None:
+            progress(batch_table, counts[batch_table])
+        batch.clear()
+
+    with gzip.open(path, "rt", encoding="utf-8") as source:
+        header = json.loads(next(source, "{}"))
+        if header.get("format") != FORMAT or header.get("version") != FORMAT_VERSION:
+            raise BackupError(f"{path} is not a {FORMAT} file of version {FORMAT_VERSION}.")
+        for line in source:
+            record = json.loads(line)
+            name, row = record["table"], record["row"]
+            if name not in by_name or name in done:
+                continue
+            if skip_through and name == skip_through[0] and row["id"] <= skip_through[1]:
+                continue
+            if name != batch_table:
+                if batch:
+                    flush()
+                if batch_table is not None:
+                    done.add(batch_table)
+                batch_table = name
+            batch.append(converters[name](row))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    dialect = session.get_bind().dialect
+    if dialect.name == "postgresql":
+        for table in tables:  # Explicit ids leave the sequences behind; move them past the imported rows
+            name = dialect.identifier_preparer.format_table(table)
+            session.execute(text(f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                                 f"COALESCE((SELECT MAX(id) FROM {name}), 0) + 1, false)"))
+        session.commit()
+    _clear_checkpoint(path, "import")
+    return counts
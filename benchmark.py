@@ -0,0 +1,414 @@
+"""Reproducible performance benchmarks for the blog.
+
+Seed a throwaway database, then drive the main routes through the Flask test client and a multi-process
+HTTP load generator. Results are printed as JSON so runs can be diffed across commits:
+
+    python benchmark.py seed --database-url sqlite:////tmp/bench.db --posts 10000 --users 100000 --comments 1000000
+    python benchmark.py run --database-url sqlite:////tmp/bench.db --output bench.json
+    python benchmark.py startup --database-url sqlite:////tmp/bench.db
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from content import process_comment, process_post
+from timestamps import POST_DATE_FORMAT, COMMENT_TIME_FORMAT
+
+BENCHMARK_PASSWORD = "benchmark-password"
+ADMIN_EMAIL = "admin@benchmark.local"
+
+
+def configure_environment(database_url, page_cache):
+    """Points the blog's configuration (read from the environment) at `database_url`."""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("APP_SECRET", "benchmark-secret")
+    os.environ.setdefault("NAME", "Benchmark")
+    os.environ.setdefault("MAIL_SERVER", "localhost")
+    os.environ.setdefault("MAIL_PORT", "1")  # Nothing listens there, so queued mail just waits
+    os.environ.setdefault("MAIL_WORKERS", "0")
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")  # Measure hashing cost on the request itself
+    for rule in ("LOGIN", "REGISTER"):
+        os.environ.setdefault(f"RATE_LIMIT_{rule}", "0")  # The auth scenarios measure the routes, not the limiter
+    if not page_cache:
+        os.environ["PAGE_CACHE_MAX_BYTES"] = "0"
+
+
+def load_app(database_url, page_cache):
+    """Builds the blog against `database_url` and brings its schema up to date. Returns the module and app."""
+    configure_environment(database_url, page_cache)
+    import main
+    app = main.create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.app_context():
+        main.init_db()
+    return main, app
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, queries=None):
+    latencies = sorted(latencies)
+    summary = {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+    }
+    if queries:
+        summary["queries_per_request"] = round(sum(queries) / len(queries), 2)
+        summary["max_queries"] = max(queries)
+    return summary
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)  # ru_maxrss is in KiB on Linux
+
+
+# ---------------------------------------------------------------------------------------------------------
+# Seeding
+
+
+def seed(args):
+    main, app = load_app(args.database_url, page_cache=False)
+    from sqlalchemy import bindparam, insert
+    rng = random.Random(args.seed)
+    db, BlogPost, User, Comment = main.db, main.BlogPost, main.User, main.Comment
+    started = time.perf_counter()
+    with app.app_context():
+        if User.query.first() is not None:
+            sys.exit("The benchmark database must be empty; point --database-url at a throwaway database.")
+        # One hash shared by every user: hashing 100k passwords would dominate the seeding time
+        password = app.extensions["password_hasher"].hash(BENCHMARK_PASSWORD)
+        epoch = datetime(2020, 1, 1)
+
+        def insert_batches(model, count, make_row, label):
+            for start in range(0, count, args.batch_size):
+                rows = [make_row(number) for number in range(start + 1, min(count, start + args.batch_size) + 1)]
+                db.session.execute(insert(model), rows)
+                db.session.commit()
+                print(f"{label}: {min(count, start + args.batch_size)}/{count}", file=sys.stderr)
+
+        def make_user(n):
+            email = ADMIN_EMAIL if n == 1 else f"user{n}@benchmark.local"
+            return dict(id=n, email=email, password=password, name=f"Benchmark User {n}",
+                        avatar_url=main.gravatar_url(email))
+
+        insert_batches(User, args.users, make_user, "users")
+
+        def make_post(n):
+            published = epoch + timedelta(hours=n)
+            body = "<p>%s</p>" % " ".join(rng.choice(WORDS) for _ in range(args.post_words))
+            return dict(id=n, author_id=1, author_name="Benchmark User 1", title=f"Benchmark post {n}", subtitle=f"Subtitle {n}",
+                        date=published.strftime(POST_DATE_FORMAT), published_at=published, body=body,
+                        **process_post(body), img_url="https://example.com/image.jpg")
+
+        insert_batches(BlogPost, args.posts, make_post, "posts")
+
+        comment_stats = {}
+
+        def make_comment(n):
+            written = epoch + timedelta(minutes=n)
+            post_id = rng.randint(1, args.posts)
+            count, _ = comment_stats.get(post_id, (0, None))
+            comment_stats[post_id] = (count + 1, written)
+            text = "<p>%s</p>" % " ".join(rng.choice(WORDS) for _ in range(12))
+            return dict(id=n, commenter_id=rng.randint(1, args.users), post_comment_id=post_id,
+                        text=text, **process_comment(text),
+                        image_url="",
+                        date_time=written.strftime(COMMENT_TIME_FORMAT), created_at=written)
+
+        insert_batches(Comment, args.comments, make_comment, "comments")
+        posts = BlogPost.__table__
+        db.session.execute(posts.update().where(posts.c.id == bindparam("post_id"))
+                           .values(comment_count=bindparam("count"), last_comment_at=bindparam("last")),
+                           [dict(post_id=post_id, count=count, last=last)
+                            for post_id, (count, last) in comment_stats.items()])
+        db.session.commit()
+        app.extensions["search_index"].rebuild(BlogPost, batch_size=args.batch_size)
+        main.rebuild_archive_months()
+    print(json.dumps({"seeded": {"users": args.users, "posts": args.posts, "comments": args.comments},
+                      "seconds": round(time.perf_counter() - started, 1)}, indent=2))
+
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+         "et dolore magna aliqua python flask database query index cache render template request worker").split()
+
+
+# ---------------------------------------------------------------------------------------------------------
+# Flask test client scenarios
+
+
+def run_test_client(main, app, args, rng):
+    from sqlalchemy import event, func
+    db, BlogPost, User = main.db, main.BlogPost, main.User
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", lambda *_: statements.append(1))
+        post_ids = [row[0] for row in db.session.query(BlogPost.id).all()]
+        max_user_id = db.session.query(func.max(User.id)).scalar() or 0
+    if not post_ids:
+        sys.exit("The benchmark database has no posts; run 'python benchmark.py seed' first.")
+
+    anonymous = app.test_client()
+    admin = app.test_client()
+    admin.post("/login", data={"email": ADMIN_EMAIL, "password": BENCHMARK_PASSWORD})
+
+    def measure(client, count, request):
+        latencies, queries = [], []
+        for number in range(count):
+            method, url, data = request(number)
+            del statements[:]
+            started = time.perf_counter()
+            response = client.open(url, method=method, data=data)
+            latencies.append(time.perf_counter() - started)
+            queries.append(len(statements))
+            if response.status_code >= 500:
+                raise RuntimeError(f"{method} {url} answered {response.status_code}")
+        return summarize(latencies, queries)
+
+    def edit_request(number):
+        post_id = rng.choice(post_ids)
+        with app.app_context():
+            post = db.session.get(BlogPost, post_id)
+            form = {"title": post.title, "subtitle": post.subtitle, "img_url": post.img_url, "author": "admin",
+                    "body": post.body, "version": str(post.version)}
+        return "POST", f"/edit-post/{post_id}", form
+
+    results = {
+        "home": measure(anonymous, args.requests, lambda n: ("GET", "/", None)),
+        "home_deep_page": measure(anonymous, args.requests,
+                                  lambda n: ("GET", f"/?before={rng.choice(post_ids)}", None)),
+        "post": measure(anonymous, args.requests, lambda n: ("GET", f"/post/{rng.choice(post_ids)}", None)),
+        "login": measure(anonymous, args.auth_requests, lambda n: (
+            "POST", "/login", {"email": ADMIN_EMAIL, "password": BENCHMARK_PASSWORD})),
+        "register": measure(app.test_client(), args.auth_requests, lambda n: (
+            "POST", "/register", {"name": "Bench", "email": f"new{max_user_id + n}-{rng.random()}@benchmark.local",
+                                  "password": BENCHMARK_PASSWORD, "copy_password": BENCHMARK_PASSWORD})),
+        "edit_post": measure(admin, args.write_requests, edit_request),
+    }
+    # Deleting runs last and on distinct posts, since it destroys data the other scenarios read
+    doomed = rng.sample(post_ids, min(args.write_requests, len(post_ids)))
+    results["delete_post"] = measure(admin, len(doomed), lambda n: ("GET", f"/delete/{doomed[n]}", None))
+    results["peak_rss_mb"] = peak_rss_mb()
+    deleted = set(doomed)
+    return results, [post_id for post_id in post_ids if post_id not in deleted]
+
+
+# ---------------------------------------------------------------------------------------------------------
+# HTTP load generator
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _load_worker(job):
+    """Runs in a separate process: sends `count` GETs over one keep-alive connection, returns latencies."""
+    base_url, paths, count, seed_value = job
+    rng = random.Random(seed_value)
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+    cookie = None
+    latencies, errors = [], 0
+    for number in range(count + 1):
+        path = rng.choice(paths)
+        started = time.perf_counter()
+        connection.request("GET", path, headers={"Cookie": cookie} if cookie else {})
+        response = connection.getresponse()
+        response.read()
+        elapsed = time.perf_counter() - started
+        set_cookie = response.getheader("Set-Cookie")
+        if set_cookie:
+            cookie = set_cookie.split(";", 1)[0]
+        if number == 0:
+            continue  # Warm-up request that establishes the session cookie
+        if response.status >= 400:
+            errors += 1
+        latencies.append(elapsed)
+    connection.close()
+    return latencies, errors
+
+
+def run_http_load(args, post_ids):
+    server = None
+    base_url = args.url
+    if base_url is None:
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--workers", str(args.server_workers), "--bind",
+             f"127.0.0.1:{port}", "--preload", "main:create_app()"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=dict(os.environ),  # Same database and settings
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _wait_for(base_url)
+    paths = ["/"] + [f"/post/{post_id}" for post_id in random.Random(args.seed).sample(
+        post_ids, min(len(post_ids), 200))]
+    jobs = [(base_url, paths, args.http_requests // args.concurrency, args.seed + number)
+            for number in range(args.concurrency)]
+    started = time.perf_counter()
+    try:
+        with multiprocessing.Pool(args.concurrency) as pool:
+            outcomes = pool.map(_load_worker, jobs)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    elapsed = time.perf_counter() - started
+    latencies = [latency for worker_latencies, _ in outcomes for latency in worker_latencies]
+    summary = summarize(latencies)
+    summary.update({
+        "url": base_url,
+        "concurrency": args.concurrency,
+        "errors": sum(errors for _, errors in outcomes),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+    })
+    if server is not None:
+        summary["server_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    return summary
+
+
+def _wait_for(base_url, timeout=30):
+    parts = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((parts.hostname, parts.port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"The benchmark server at {base_url} did not start")
+
+
+# ---------------------------------------------------------------------------------------------------------
+# Startup time
+
+# Runs in a fresh interpreter so nothing is already imported or cached
+STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+response = app.test_client().get("/", follow_redirects=True)
+answered = time.perf_counter()
+print(json.dumps({"import_s": imported - started, "create_app_s": created - imported,
+                  "first_page_s": answered - created, "status": response.status_code}))
+"""
+
+
+def startup(args):
+    configure_environment(args.database_url, page_cache=True)
+    samples = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        output = subprocess.check_output([sys.executable, "-c", STARTUP_PROBE], text=True, env=dict(os.environ),
+                                         cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL)
+        sample = json.loads(output.strip().splitlines()[-1])
+        if sample.pop("status") != 200:
+            sys.exit("The first page did not load; is the database initialised ('flask --app main init-db')?")
+        sample["process_s"] = time.perf_counter() - started
+        samples.append(sample)
+    report = {"revision": git_revision(), "runs": args.runs}
+    for key in ("import_s", "create_app_s", "first_page_s", "process_s"):
+        values = sorted(sample[key] for sample in samples)
+        report[key] = {"median": round(values[len(values) // 2], 4), "min": round(values[0], 4)}
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    from sqlalchemy.engine import make_url
+    rng = random.Random(args.seed)
+    main, app = load_app(args.database_url, page_cache=args.page_cache)
+    report = {
+        "revision": git_revision(),
+        "database": make_url(args.database_url).render_as_string(hide_password=True),
+        "page_cache": args.page_cache,
+        "seed": args.seed,
+    }
+    with app.app_context():
+        report["dataset"] = {
+            "users": main.User.query.count(),
+            "posts": main.BlogPost.query.count(),
+            "comments": main.Comment.query.count(),
+        }
+    report["test_client"], post_ids = run_test_client(main, app, args, rng)
+    if not args.skip_http:
+        report["http"] = run_http_load(args, post_ids)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Fill an empty database with generated content.")
+    seed_parser.add_argument("--database-url", required=True)
+    seed_parser.add_argument("--users", type=int, default=100_000)
+    seed_parser.add_argument("--posts", type=int, default=10_000)
+    seed_parser.add_argument("--comments", type=int, default=1_000_000)
+    seed_parser.add_argument("--post-words", type=int, default=800, help="Words in each generated post body.")
+    seed_parser.add_argument("--batch-size", type=int, default=5_000)
+    seed_parser.add_argument("--seed", type=int, default=42)
+    seed_parser.set_defaults(func=seed)
+
+    run_parser = commands.add_parser("run", help="Benchmark the routes against a seeded database.")
+    run_parser.add_argument("--database-url", required=True)
+    run_parser.add_argument("--requests", type=int, default=200, help="Requests per read scenario.")
+    run_parser.add_argument("--auth-requests", type=int, default=20, help="Requests per login/register scenario.")
+    run_parser.add_argument("--write-requests", type=int, default=20, help="Requests per edit/delete scenario.")
+    run_parser.add_argument("--page-cache", action="store_true", help="Keep the rendered page cache enabled.")
+    run_parser.add_argument("--skip-http", action="store_true", help="Only run the test client scenarios.")
+    run_parser.add_argument("--url", help="Load-test an already running server instead of starting gunicorn.")
+    run_parser.add_argument("--server-workers", type=int, default=2)
+    run_parser.add_argument("--concurrency", type=int, default=4, help="Load generator processes.")
+    run_parser.add_argument("--http-requests", type=int, default=2_000)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--output", help="Also write the JSON report to this file.")
+    run_parser.set_defaults(func=run)
+
+    startup_parser = commands.add_parser(
+        "startup", help="Time importing main, create_app() and the first page, each in a fresh interpreter.")
+    startup_parser.add_argument("--database-url", required=True)
+    startup_parser.add_argument("--runs", type=int, default=10)
+    startup_parser.add_argument("--output", help="Also write the JSON report to this file.")
+    startup_parser.set_defaults(func=startup)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    arguments.func(arguments)
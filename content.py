@@ -0,0 +1,148 @@
+import math
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from sqlalchemy import bindparam, select
+
+from search import html_to_text
+
+# Bump whenever the output of the pipeline changes; `flask reprocess-content` re-renders older rows
+PIPELINE_VERSION = 1
+
+ALLOWED_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "caption", "code", "div", "em", "figcaption", "figure", "h1", "h2",
+    "h3", "h4", "h5", "h6", "hr", "i", "img", "li", "ol", "p", "pre", "s", "span", "strong", "sub", "sup",
+    "table", "tbody", "td", "tfoot", "th", "thead", "tr", "u", "ul",
+}
+ALLOWED_ATTRIBUTES = {
+    "*": {"class", "title"},
+    "a": {"href", "target"},
+    "img": {"src", "alt", "width", "height"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan"},
+}
+URL_ATTRIBUTES = {"href", "src"}
+ALLOWED_SCHEMES = {"", "http", "https", "mailto"}
+VOID_TAGS = {"br", "hr", "img"}
+# Tags dropped together with everything inside them; other disallowed tags only lose their markup
+DROPPED_TAGS = {"script", "style", "iframe", "object", "embed", "template", "noscript", "svg", "math"}
+
+EXCERPT_LENGTH = 200
+WORDS_PER_MINUTE = 200
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.open_tags = []
+        self._dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self._dropping += 1
+        if self._dropping or tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRIBUTES["*"] | ALLOWED_ATTRIBUTES.get(tag, set())
+        kept = {}
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and urlsplit(value.strip()).scheme.lower() not in ALLOWED_SCHEMES:
+                continue
+            kept[name] = value
+        if tag == "img":
+            kept.update(loading="lazy", decoding="async")
+        elif tag == "a" and kept.get("target") == "_blank":
+            kept["rel"] = "noopener noreferrer"
+        self.parts.append("<%s%s>" % (tag, "".join(' %s="%s"' % (name, escape(value)) for name, value in kept.items())))
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in DROPPED_TAGS:
+            self._dropping -= 1
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self._dropping = max(self._dropping - 1, 0)
+            return
+        if self._dropping or tag not in self.open_tags:
+            return
+        while self.open_tags:  # Also closes anything left open inside this tag
+            open_tag = self.open_tags.pop()
+            self.parts.append("</%s>" % open_tag)
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self._dropping:
+            self.parts.append(escape(data, quote=False))
+
+    def result(self):
+        self.close()
+        return "".join(self.parts + ["</%s>" % tag for tag in reversed(self.open_tags)])
+
+
+def sanitize(markup):
+    """Returns `markup` reduced to the allowed tags, attributes and URL schemes, with images lazy-loaded."""
+    sanitizer = _Sanitizer()
+    sanitizer.feed(markup or "")
+    return sanitizer.result()
+
+
+def excerpt(text, length=EXCERPT_LENGTH):
+    """Shortens plain text to at most `length` characters, cutting at a word boundary."""
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(" ", 1)[0].rstrip(" ,.;:") + "…"
+
+
+def reading_time(text):
+    """Estimated minutes needed to read `text`, at least one."""
+    return max(1, math.ceil(len(text.split()) / WORDS_PER_MINUTE))
+
+
+def process_post(body):
+    """Runs a post body through the write-time pipeline and returns the columns to store."""
+    text = html_to_text(body)
+    return dict(body_html=sanitize(body), excerpt=excerpt(text), reading_time=reading_time(text),
+                content_version=PIPELINE_VERSION)
+
+
+def process_comment(text):
+    """Runs a comment through the write-time pipeline and returns the columns to store."""
+    return dict(text_html=sanitize(text), content_version=PIPELINE_VERSION)
+
+
+def reprocess(session, table, source, process, batch_size=200, progress=None):
+    """Re-runs `process` over the `source` column of every row rendered by an older pipeline version.
+
+    Rows are walked in primary key order and each batch is committed on its own. A row whose source
+    changed since it was read is left alone, as the change already stored freshly rendered HTML, and is
+    not counted. Returns the number of rows rewritten.
+    """
+    source_column = table.c[source]
+    columns = list(process(""))  # The columns this pipeline stage writes
+    statement = (table.update()
+                 .where(table.c.id == bindparam("row_id"), source_column == bindparam("old_source"))
+                 .values({name: bindparam(f"new_{name}") for name in columns}))
+    updated, last_id = 0, 0
+    while True:
+        rows = session.execute(
+            select(table.c.id, source_column)
+            .where(table.c.content_version < PIPELINE_VERSION, table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)).all()
+        if not rows:
+            return updated
+        params = [dict({f"new_{name}": value for name, value in process(row[1]).items()},
+                       row_id=row.id, old_source=row[1])
+                  for row in rows]
+        updated += session.execute(statement, params).rowcount  # Rows the source guard let through
+        session.commit()
+        last_id = rows[-1].id
+        if progress is not None:
+            progress(updated)
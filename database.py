@@ -0,0 +1,113 @@
+import sqlite3
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+
+def engine_options(config, url=None):
+    """Returns the engine options for `url` (the main database by default) built from the DB_* settings.
+
+    SQLite keeps SQLAlchemy's own pool defaults and is tuned with pragmas on connect instead; server
+    databases get a sized pool that recycles and pings its connections, and PostgreSQL a statement timeout.
+    """
+    backend = make_url(url or config["SQLALCHEMY_DATABASE_URI"]).get_backend_name()
+    if backend == "sqlite":
+        return {}
+    options = {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+    if backend == "postgresql" and config["DB_STATEMENT_TIMEOUT_MS"]:
+        options["connect_args"] = {"options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def app_engines(app, db):
+    """Every engine `app` talks to: the Flask-SQLAlchemy engines and the read replica, if one is set."""
+    with app.app_context():
+        engines = list(db.engines.values())
+    tuning = app.extensions.get("database_tuning")
+    if tuning is not None and tuning.replica is not None:
+        engines.append(tuning.replica)
+    return engines
+
+
+class RoutingSession(Session):
+    """db.session class sending the reads of views marked @read_only to the replica engine, if one is set.
+
+    Anything flushed by the session still goes to the primary, as does every statement of a browser that
+    committed something in the last DATABASE_REPLICA_LAG seconds, so people always see their own changes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get("read_only"):
+            replica = current_app.extensions["database_tuning"].replica
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_write(db_session):
+    """Notes that the request committed to the primary; registered once here rather than per app."""
+    if has_request_context():
+        g.wrote_to_primary = True
+
+
+def read_only(func):
+    """Marks a view whose GET requests may be answered from the replica."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if request.method in ("GET", "HEAD") and session.get("primary_until", 0) < time.time():
+            g.read_only = True
+        return func(*args, **kwargs)
+    return wrapper
+
+
+class DatabaseTuning:
+    """Applies the SQLite pragmas on every new connection and owns the optional read replica engine."""
+
+    def __init__(self, app=None, db=None):
+        self.pragmas = {}
+        self.replica = None
+        self.replica_lag = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault("SQLITE_JOURNAL_MODE", "wal")
+        app.config.setdefault("SQLITE_SYNCHRONOUS", "normal")
+        app.config.setdefault("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+        app.config.setdefault("DATABASE_REPLICA_URL", None)
+        app.config.setdefault("DATABASE_REPLICA_LAG", 5)
+        self.pragmas = {"journal_mode": app.config["SQLITE_JOURNAL_MODE"],
+                        "synchronous": app.config["SQLITE_SYNCHRONOUS"],
+                        "mmap_size": int(app.config["SQLITE_MMAP_SIZE"])}
+        self.replica_lag = app.config["DATABASE_REPLICA_LAG"]
+        replica_url = app.config["DATABASE_REPLICA_URL"]
+        if replica_url:
+            self.replica = create_engine(replica_url, **engine_options(app.config, replica_url))
+            app.after_request(self._pin_to_primary)
+        app.extensions["database_tuning"] = self
+        for engine in app_engines(app, db):  # This app's engines only, so other apps keep their own pragmas
+            event.listen(engine, "connect", self._configure_sqlite)
+
+    def _configure_sqlite(self, dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")  # Values come from configuration, never from requests
+        cursor.close()
+
+    def _pin_to_primary(self, response):
+        if g.get("wrote_to_primary"):
+            session["primary_until"] = time.time() + self.replica_lag
+        return response
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, PasswordField, EmailField
+from wtforms import StringField, SubmitField, PasswordField, EmailField, HiddenField
 from wtforms.validators import InputRequired, URL, Length, EqualTo, ValidationError
 from flask_ckeditor import CKEditorField
 
@@ -12,6 +12,7 @@ class CreatePostForm(FlaskForm):
                           render_kw={"placeholder": "Enter Blog Image Link"})
     author = StringField("Author", validators=[InputRequired()], render_kw={"placeholder": "Enter Blog Author"})
     body = CKEditorField("Blog Content", validators=[InputRequired()], render_kw={"placeholder": "Enter Blog Content"})
+    version = HiddenField()
     submit = SubmitField("Submit Post")
 
 
@@ -1,62 +1,58 @@
 # Importing required libraries
-import smtplib
-from flask import Flask, render_template, redirect, url_for, flash, request, session
+from flask import Flask, render_template, redirect, url_for, flash, request, session, make_response, jsonify, current_app
+from flask.json.provider import DefaultJSONProvider
 from flask_bootstrap import Bootstrap
 from flask_ckeditor import CKEditor
 from datetime import date, datetime, timedelta
 import json
-from sqlalchemy.dialects.postgresql import Any
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from typing import Any
 from werkzeug.exceptions import abort
-from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
+from functools import wraps, lru_cache
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, ForeignKey
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, Integer, ForeignKey, inspect, func, select, bindparam, extract, and_, or_
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.orm import relationship, declarative_base, load_only, contains_eager, joinedload, validates
 from flask_login import UserMixin, login_user, LoginManager, login_required, current_user, logout_user
 from forms import CreatePostForm, RegisterForm, ValidationError, LoginForm, CommentForm, ForgotPasswordForm, VerifyCodeForm, ChangePasswordForm
-from libgravatar import Gravatar
+from outbox import Outbox
+from page_cache import PageCache
+from passwords import PasswordHasher, PasswordHasherBusy
+from ratelimit import RateLimiter, RateLimited
+from search import SearchIndex, highlight
+from backup import BackupError, export_tables, import_tables
+from metrics import Instrumentation, registry
+from database import DatabaseTuning, RoutingSession, app_engines, engine_options, read_only
+from user_cache import UserCache
+from sessions import DatabaseSessionInterface
+from content import process_post, process_comment, reprocess, sanitize
+from syndication import Syndication
+from assets import Assets
+from markupsafe import Markup
+from timestamps import POST_DATE_FORMAT, COMMENT_TIME_FORMAT, post_date, comment_time, migrate_timestamps
 import dotenv
 import os
+import click
+from flask.cli import AppGroup
 
-# Loading environment variables from .env file
-new_file = dotenv.find_dotenv()
-dotenv.load_dotenv(new_file)
-
-# Setting up required variables
-dev_name = os.getenv("NAME")
-date_ = date.today()
-year = date_.year
-LINKEDIN = os.environ.get("LINKED-IN")
-GITHUB = os.getenv("GIT-HUB")
-TWITTER = os.environ.get("TWITTER_")
-MY_RESUME = os.getenv("RESUME")
-MY_EMAIL = os.environ.get("MY_EMAIL")
-MY_PASS = os.getenv("EMAIL_PASSWORD")
-ANOTHER_EMAIL = os.environ.get("OTHER_EMAIL")
-SECOND_EMAIL = os.environ.get("SECOND_EMAIL")
-mail_list = [SECOND_EMAIL, MY_EMAIL, ANOTHER_EMAIL]
-database = os.environ.get("DATABASE")
-
-# Creating a Flask app instance
-app = Flask(__name__)
-
-# Setting up required configurations
-app.config['SECRET_KEY'] = os.getenv("APP_SECRET")
-ckeditor = CKEditor(app)
-Bootstrap(app)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL",  f"sqlite:///{database}.db").replace("postgres://", "postgresql://", 1)
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Creating a SQLAlchemy instance for our app
-db = SQLAlchemy(app)
+# The INSERT ... ON CONFLICT constructs of the databases the blog runs on, for counters that must upsert
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+# Creating a SQLAlchemy instance; it is attached to the app in create_app()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 Base = declarative_base()
 
-# Initializing Login Manager for user authentication
-login_manager = LoginManager()
-login_manager.session_protection = "strong"
-login_manager.login_view = 'login'
-login_manager.login_message_category = "info"
-login_manager.init_app(app)
+@lru_cache(maxsize=4096)
+def gravatar_url(email):
+    """Returns the Gravatar image URL for an email address."""
+    from libgravatar import Gravatar    # Imported on first use instead of at startup
+    return Gravatar(email).get_image()
 
 
 # Creating SQLAlchemy models for our database tables
@@ -64,15 +60,48 @@ class BlogPost(Base, db.Model):
     """This table stores details of each Blog article"""
     __tablename__ = "blog_posts"
     id = db.Column(db.Integer, primary_key=True)
-    author_id = Column(Integer, ForeignKey("user.id"))
+    author_id = Column(Integer, ForeignKey("user.id"), index=True)    # Indexed for the /author/<id> pages
     title = db.Column(db.String(250), unique=True, nullable=False)
     subtitle = db.Column(db.String(250), nullable=False)
     date = db.Column(db.String(250), nullable=False)
     body = db.Column(db.Text(), nullable=False)
     img_url = db.Column(db.String(250), nullable=False)
     last_edit = db.Column(db.String(250))
+    published_at = db.Column(db.DateTime, index=True)    # Typed twin of `date`; NULL until migrate-timestamps has run
+    edited_at = db.Column(db.DateTime)    # Typed twin of `last_edit`
+    version = db.Column(db.Integer, nullable=False, server_default="1")   # Bumped on every UPDATE to detect concurrent edits
+    # Denormalized for the homepage; kept current by the routes and recomputed by `flask repair-post-stats`
+    author_name = db.Column(db.String(250), nullable=False, server_default="")    # Backfilled by init_db()
+    comment_count = db.Column(db.Integer, nullable=False, server_default="0")
+    last_comment_at = db.Column(db.DateTime)
+    # Output of the write-time content pipeline (see content.py), stored so page views never re-sanitize
+    body_html = db.Column(db.Text())
+    excerpt = db.Column(db.Text())
+    reading_time = db.Column(db.Integer)
+    content_version = db.Column(db.Integer, nullable=False, server_default="0")
     author = relationship("User", backref="blog_posts")
     article_commenter = relationship("Comment", backref="blog_posts")
+    __mapper_args__ = {"version_id_col": version}
+
+    @property
+    def safe_body(self):
+        """The stored sanitized body, or the body sanitized on the fly if `flask reprocess-content` hasn't reached it."""
+        return Markup(self.body_html if self.body_html is not None else sanitize(self.body))
+
+    def to_json(self):
+        """The post as served by the JSON endpoints: the homepage summary, not the body."""
+        return {
+            "id": self.id,
+            "title": self.title,
+            "subtitle": self.subtitle,
+            "author": self.author_name,
+            "published_at": self.published_at.isoformat() if self.published_at else None,
+            "edited_at": self.edited_at.isoformat() if self.edited_at else None,
+            "excerpt": self.excerpt,
+            "reading_time": self.reading_time,
+            "comment_count": self.comment_count,
+            "img_url": self.img_url,
+        }
 
     def __repr__(self):
         return "<Title %r>" % self.title
@@ -85,9 +114,28 @@ class User(Base, UserMixin, db.Model):
     email = db.Column(db.String(500), unique=True, nullable=False)
     password = db.Column(db.String(250), nullable=False)
     name = db.Column(db.String(250), nullable=False)
+    avatar_url = db.Column(db.String(1000))    # Gravatar URL, stored whenever the email is set
     articles = relationship("BlogPost", backref="user")
     remark = relationship("Comment", backref='user')
 
+    @validates("email")
+    def update_avatar_url(self, key, email):
+        self.avatar_url = gravatar_url(email)
+        return email
+
+    @property
+    def avatar(self):
+        """The stored avatar URL, or one computed from the email for users `flask collapse-avatars` hasn't reached."""
+        return self.avatar_url or gravatar_url(self.email)
+
+    @property
+    def is_admin(self):
+        return self.id == 1     # The first registered user is the admin
+
+    def to_json(self):
+        """The public part of the user; the email and password hash are never serialized."""
+        return {"id": self.id, "name": self.name, "avatar": self.avatar}
+
     def __repr__(self):
         return "<User %r>" % self.name
 
@@ -97,101 +145,692 @@ class Comment(Base, db.Model):
     __tablename__ = "comments"
     id = db.Column(db.Integer, primary_key=True, unique=True)
     commenter_id = Column(Integer, ForeignKey("user.id"), nullable=False)
-    post_comment_id = Column(Integer, ForeignKey("blog_posts.id"), nullable=False)
+    post_comment_id = Column(Integer, ForeignKey("blog_posts.id"), nullable=False, index=True)
     text = db.Column(db.String(1000), nullable=False)
-    image_url = db.Column(db.String(1000), nullable=False)
+    image_url = db.Column(db.String(1000), nullable=False)    # Legacy copy of the commenter's avatar; now left empty
     date_time = db.Column(db.String(250), nullable=False)
+    created_at = db.Column(db.DateTime, index=True)    # Typed twin of `date_time`; NULL until migrate-timestamps has run
+    text_html = db.Column(db.Text())     # Sanitized `text`, stored by the write-time content pipeline
+    content_version = db.Column(db.Integer, nullable=False, server_default="0")
     commenter = relationship("User", backref='comments')
     post_comment = relationship("BlogPost", backref="comments")
 
+    @property
+    def safe_text(self):
+        """The stored sanitized comment, or the comment sanitized on the fly if it hasn't been reprocessed."""
+        return Markup(self.text_html if self.text_html is not None else sanitize(self.text))
+
+    def to_json(self):
+        """The comment as appended to the post page: its sanitized HTML, commenter and display time."""
+        return {
+            "id": self.id,
+            "post_id": self.post_comment_id,
+            "author": self.commenter,
+            "html": str(self.safe_text),
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "time": comment_time(self.created_at, self.date_time),
+        }
+
     def __repr__(self):
         return "<Comment %r>" % self.text
 
 
+class PasswordReset(Base, db.Model):
+    """This table stores password reset requests so any server process can verify the emailed code."""
+    __tablename__ = "password_resets"
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False, index=True)
+    code_hash = db.Column(db.String(64), nullable=False)    # SHA-256 of the emailed code; the code itself only sits in the outbox until sent
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    verified_at = db.Column(db.DateTime)
+    used_at = db.Column(db.DateTime)
+    user = relationship("User")
+
+    def __repr__(self):
+        return "<PasswordReset %r>" % self.id
+
+
+class SessionRecord(Base, db.Model):
+    """This table stores browser sessions when SESSION_STORE is set to "database"."""
+    __tablename__ = "sessions"
+    id = db.Column(db.String(64), primary_key=True)    # SHA-256 of the id in the session cookie
+    data = db.Column(db.Text(), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return "<Session %r>" % self.expires_at
+
+
+class ArchiveMonth(Base, db.Model):
+    """This table counts the posts published in each month, for the archive links and pages."""
+    __tablename__ = "archive_months"
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, server_default="0")
+
+    @property
+    def label(self):
+        return date(self.year, self.month, 1).strftime("%B %Y")
+
+    def __repr__(self):
+        return "<ArchiveMonth %r>" % self.label
+
+
+class OutboxMessage(Base, db.Model):
+    """This table queues outgoing emails until a background worker has delivered them."""
+    __tablename__ = "outbox"
+    id = db.Column(db.Integer, primary_key=True)
+    from_addr = db.Column(db.String(500), nullable=False)
+    to_addrs = db.Column(db.Text(), nullable=False)     # JSON list of recipients
+    message = db.Column(db.Text(), nullable=False)     # Emptied once the message is sent or given up on
+    status = db.Column(db.String(20), nullable=False, default="pending")   # pending, sending, sent or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_error = db.Column(db.String(1000))
+    created_at = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return "<OutboxMessage %r>" % self.id
+
+
 class ModelEncoder(json.JSONEncoder):
     def default(self, o: Any) -> Any:
         if hasattr(o, 'to_json'):
             return o.to_json()
+        elif isinstance(o, (date, datetime)):
+            return o.isoformat()
         else:
             return super(ModelEncoder, self).default(o)
 
 
-app.json_provider_class = ModelEncoder
-with app.app_context():
+class ModelJSONProvider(DefaultJSONProvider):
+    """Lets jsonify() serialize models the same way ModelEncoder does, through their to_json methods."""
+
+    @staticmethod
+    def default(o: Any) -> Any:
+        if hasattr(o, 'to_json'):
+            return o.to_json()
+        return DefaultJSONProvider.default(o)
+
+
+# Cache statistics for /metrics, read from the current app's caches each time the metrics are collected
+page_cache_requests = registry.gauge("page_cache_requests", "Rendered page cache lookups since start.", ["result"])
+page_cache_entries = registry.gauge("page_cache_entries", "Pages currently held in the rendered page cache.")
+user_cache_requests = registry.gauge("user_cache_requests", "Logged-in user cache lookups since start.", ["result"])
+user_cache_entries = registry.gauge("user_cache_entries", "Users currently held in the logged-in user cache.")
+
+
+@registry.on_collect
+def collect_page_cache_stats():
+    page_cache = current_app.extensions["page_cache"]
+    page_cache_requests.set(page_cache.hits, result="hit")
+    page_cache_requests.set(page_cache.misses, result="miss")
+    page_cache_entries.set(len(page_cache))
+
+
+@registry.on_collect
+def collect_user_cache_stats():
+    user_cache = current_app.extensions["user_cache"]
+    user_cache_requests.set(user_cache.hits, result="hit")
+    user_cache_requests.set(user_cache.misses, result="miss")
+    user_cache_entries.set(len(user_cache))
+
+
+def upgrade_schema():
+    """db.create_all() skips tables that already exist, so columns and indexes added to existing models are created here."""
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    connection.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_ddl}")
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+
+def rebuild_archive_months():
+    """Recomputes the archive_months summary from the posts' published_at column. Needs an app context."""
+    months, posts = ArchiveMonth.__table__, BlogPost.__table__
+    year, month = extract("year", posts.c.published_at), extract("month", posts.c.published_at)
+    db.session.execute(months.delete())
+    db.session.execute(months.insert().from_select(
+        ["year", "month", "post_count"],
+        select(year, month, func.count()).where(posts.c.published_at.isnot(None)).group_by(year, month)))
+    db.session.commit()
+
+
+def backfill_author_names(batch_size=1000):
+    """Fills in author_name for posts saved before it was denormalized, so listings never load the author.
+
+    Walks the posts by id in batches. On PostgreSQL the column is then made NOT NULL; SQLite cannot add the
+    constraint to an existing column, so there it only holds for databases created with it. Needs an app context.
+    """
+    posts, users = BlogPost.__table__, User.__table__
+    missing = or_(posts.c.author_name.is_(None), and_(posts.c.author_name == "", posts.c.author_id.isnot(None)))
+    last_id = 0
+    while True:
+        ids = db.session.scalars(select(posts.c.id).where(posts.c.id > last_id, missing)
+                                 .order_by(posts.c.id).limit(batch_size)).all()
+        if not ids:
+            break
+        author_name = select(users.c.name).where(users.c.id == posts.c.author_id).scalar_subquery()
+        db.session.execute(posts.update().where(posts.c.id.in_(ids))
+                           .values(author_name=func.coalesce(author_name, posts.c.author_name, "")))
+        db.session.commit()
+        last_id = ids[-1]
+    if db.engine.dialect.name == "postgresql":
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("ALTER TABLE blog_posts ALTER COLUMN author_name SET NOT NULL")
+
+
+def init_db():
+    """Creates the missing tables, columns and indexes and the search index. Needs an app context."""
     db.create_all()
-    logged_in = False
-    next_route = None
-    editing = False
-    value = None
-    displayed_flash = False
-    random_password = None
-    email_exists = False
-    user_verified = False
-    forgot_pass = False
-    reset_user = None
+    upgrade_schema()
+    backfill_author_names()
+    current_app.extensions["search_index"].create()
+
+
+def create_app():
+    """Builds the blog application.
+
+    Nothing here touches the database, so workers start quickly, and `gunicorn --preload` can build the app
+    once in the master and fork workers from it. The schema is created by `flask init-db` instead."""
+    # Loading environment variables from .env file
+    new_file = dotenv.find_dotenv()
+    dotenv.load_dotenv(new_file)
+
+    # Setting up required variables
+    dev_name = os.getenv("NAME")
+    date_ = date.today()
+    year = date_.year
+    LINKEDIN = os.environ.get("LINKED-IN")
+    GITHUB = os.getenv("GIT-HUB")
+    TWITTER = os.environ.get("TWITTER_")
+    MY_RESUME = os.getenv("RESUME")
+    MY_EMAIL = os.environ.get("MY_EMAIL")
+    MY_PASS = os.getenv("EMAIL_PASSWORD")
+    ANOTHER_EMAIL = os.environ.get("OTHER_EMAIL")
+    SECOND_EMAIL = os.environ.get("SECOND_EMAIL")
+    mail_list = [SECOND_EMAIL, MY_EMAIL, ANOTHER_EMAIL]
+    database = os.environ.get("DATABASE")
+
+    # Creating a Flask app instance
+    app = Flask(__name__)
+
+    # Setting up required configurations
+    app.config['SECRET_KEY'] = os.getenv("APP_SECRET")
+    ckeditor = CKEditor(app)
+    Bootstrap(app)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL",  f"sqlite:///{database}.db").replace("postgres://", "postgresql://", 1)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DATABASE_REPLICA_URL'] = os.environ.get("DATABASE_REPLICA_URL", "").replace("postgres://", "postgresql://", 1) or None  # Optional replica for read-only pages
+    app.config['DATABASE_REPLICA_LAG'] = int(os.environ.get("DATABASE_REPLICA_LAG", 5))  # Seconds a writer keeps reading the primary
+
+    # Connection pool settings for server databases (SQLite is tuned with the pragmas below instead)
+    app.config['DB_POOL_SIZE'] = int(os.environ.get("DB_POOL_SIZE", 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get("DB_POOL_TIMEOUT", 30))  # Seconds to wait for a free connection
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get("DB_POOL_RECYCLE", 1800))  # Reconnect before the server drops idle connections
+    app.config['DB_POOL_PRE_PING'] = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))  # PostgreSQL only; 0 disables
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    app.config['SQLITE_JOURNAL_MODE'] = os.environ.get("SQLITE_JOURNAL_MODE", "wal")  # Readers no longer wait for writers
+    app.config['SQLITE_SYNCHRONOUS'] = os.environ.get("SQLITE_SYNCHRONOUS", "normal")
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    app.config['POSTS_PER_PAGE'] = int(os.environ.get("POSTS_PER_PAGE", 10))  # Number of posts shown per homepage page
+    app.config['COMMENTS_PER_PAGE'] = int(os.environ.get("COMMENTS_PER_PAGE", 20))  # Number of comments shown per post page
+    app.config['COMMENTS_LONG_POLL_MAX'] = int(os.environ.get("COMMENTS_LONG_POLL_MAX", 0))  # Longest a comments request may wait, in seconds; 0 turns long-polling off
+    app.config['COMMENTS_POLL_INTERVAL'] = float(os.environ.get("COMMENTS_POLL_INTERVAL", 1))  # How often a waiting request rechecks the database
+    app.config['SLOW_QUERY_MS'] = int(os.environ.get("SLOW_QUERY_MS", 200))  # SQL statements slower than this are logged
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=int(os.environ.get("SESSION_LIFETIME", 15)))  # Idle time before a login expires
+    app.config['SESSION_REFRESH_EACH_REQUEST'] = False  # The cookie is re-issued by `make_session_permanent` only when due
+    app.config['SESSION_REFRESH_AFTER'] = int(os.environ.get("SESSION_REFRESH_AFTER", 300))  # Seconds between re-issues of a session cookie
+    app.config['SESSION_STORE'] = os.environ.get("SESSION_STORE", "cookie")  # "database" keeps session data server-side
+    app.config['PASSWORD_RESET_TTL'] = timedelta(minutes=int(os.environ.get("PASSWORD_RESET_TTL", 30)))  # Reset code lifetime
+    app.config['PAGE_CACHE_MAX_BYTES'] = int(os.environ.get("PAGE_CACHE_MAX_BYTES", 32 * 1024 * 1024))  # Rendered page cache size
+    app.config['PAGE_CACHE_TTL'] = int(os.environ.get("PAGE_CACHE_TTL", 300))  # Seconds a rendered page may be served from cache
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get("USER_CACHE_SIZE", 10000))  # Logged-in users kept in memory per process
+    app.config['USER_CACHE_TTL'] = int(os.environ.get("USER_CACHE_TTL", 60))  # Seconds before a cached user is reloaded
+    app.config['SYNDICATION_FEED_SIZE'] = int(os.environ.get("SYNDICATION_FEED_SIZE", 20))  # Newest posts listed in /feed.xml
+    app.config['SYNDICATION_TTL'] = int(os.environ.get("SYNDICATION_TTL", 300))  # Seconds before the feed and sitemap are rebuilt
+    app.config['SYNDICATION_TITLE'] = f"{dev_name}'s Blog"
+
+    # Outgoing mail settings; point MAIL_SERVER/MAIL_PORT at a local SMTP stand-in and set MAIL_USE_TLS=false to test
+    app.config['MAIL_SERVER'] = os.environ.get("MAIL_SERVER", "smtp.office365.com")
+    app.config['MAIL_PORT'] = int(os.environ.get("MAIL_PORT", 587))
+    app.config['MAIL_USE_TLS'] = os.environ.get("MAIL_USE_TLS", "true").lower() == "true"
+    app.config['MAIL_USERNAME'] = os.environ.get("MAIL_USERNAME", MY_EMAIL)
+    app.config['MAIL_PASSWORD'] = os.environ.get("MAIL_PASSWORD", MY_PASS)
+    app.config['MAIL_WORKERS'] = int(os.environ.get("MAIL_WORKERS", 2))  # Background threads sending queued mail
+    app.config['MAIL_POOL_SIZE'] = int(os.environ.get("MAIL_POOL_SIZE", 2))  # SMTP connections kept open for reuse
+    app.config['MAIL_RETENTION_DAYS'] = int(os.environ.get("MAIL_RETENTION_DAYS", 7))  # Sent and failed mail kept this long
+
+    # Password hashing policy; stored hashes weaker than this are upgraded the next time their owner logs in
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+    app.config['PASSWORD_SALT_LENGTH'] = int(os.environ.get("PASSWORD_SALT_LENGTH", 16))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get("PASSWORD_HASH_WORKERS", 1))  # 0 hashes on the request thread
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get("PASSWORD_HASH_QUEUE", 8))  # Hashing jobs allowed in flight
+
+    # Rate limits on the routes that hash passwords or send email, per client IP and per submitted email
+    app.config['RATE_LIMIT_LOGIN'] = os.environ.get("RATE_LIMIT_LOGIN", "10/minute")
+    app.config['RATE_LIMIT_REGISTER'] = os.environ.get("RATE_LIMIT_REGISTER", "5/minute")
+    app.config['RATE_LIMIT_FORGOT_PASSWORD'] = os.environ.get("RATE_LIMIT_FORGOT_PASSWORD", "5/hour")
+    app.config['RATE_LIMIT_CONTACT'] = os.environ.get("RATE_LIMIT_CONTACT", "5/hour")
+    app.config['RATE_LIMIT_STORAGE'] = os.environ.get("RATE_LIMIT_STORAGE", "")  # SQLite file shared by all workers; empty keeps limits per process
+    app.config['RATE_LIMIT_PROXIES'] = int(os.environ.get("RATE_LIMIT_PROXIES", 0))  # Proxies in front of the app whose X-Forwarded-For is trusted
+
+    # Creating this app's own extensions, so several apps in one process never share caches, queues or limits;
+    # code outside create_app() finds them in app.extensions
+    login_manager = LoginManager()     # Login Manager for user authentication
+    login_manager.session_protection = "strong"
+    login_manager.login_view = 'login'
+    login_manager.login_message_category = "info"
+    outbox = Outbox()
+    password_hasher = PasswordHasher()
+    rate_limiter = RateLimiter()
+    search_index = SearchIndex()
+    syndication = Syndication()
+    assets = Assets()
+    page_cache = PageCache()
+    user_cache = UserCache()
+
+    # Attaching the extensions to this app
+    db.init_app(app)
+    DatabaseTuning(app, db)
+    login_manager.init_app(app)
+    app.json = ModelJSONProvider(app)
+    if app.config['SESSION_STORE'] == "database":
+        app.session_interface = DatabaseSessionInterface(db, SessionRecord)
+    outbox.init_app(app, db, OutboxMessage)
+    Instrumentation(app, app_engines(app, db))
+    password_hasher.init_app(app)
+    rate_limiter.init_app(app)
+    search_index.init_app(app, db)
+    app.add_template_filter(highlight)
+    app.add_template_filter(post_date)
+    app.add_template_filter(comment_time)
+    syndication.init_app(app, db, BlogPost)
+    assets.init_app(app)
+    page_cache.init_app(app)
+    user_cache.init_app(app)
+
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Creates the database schema and search index, adding anything new to an existing database."""
+        init_db()
+        click.echo("Database is up to date.")
+
+    blog_cli = AppGroup("blog", help="Exports and imports the blog's users, posts and comments.")
+    app.cli.add_command(blog_cli)
+    backup_tables = [User.__table__, BlogPost.__table__, Comment.__table__]    # Parents before the rows that refer to them
+
+    @blog_cli.command("export")
+    @click.argument("path", type=click.Path(dir_okay=False))
+    @click.option("--batch-size", default=1000, show_default=True, help="Rows read per query.")
+    @click.option("--resume", is_flag=True, help="Carry on with an export that was interrupted.")
+    def export_command(path, batch_size, resume):
+        """Writes every user, post and comment to PATH as gzip-compressed JSON lines."""
+        try:
+            counts = export_tables(db.session, backup_tables, path, ModelEncoder, batch_size=batch_size,
+                                   resume=resume, progress=lambda table, count: click.echo(f"{table}: {count} rows exported"))
+        except BackupError as error:
+            raise click.ClickException(str(error))
+        click.echo("Exported " + ", ".join(f"{count} {table}" for table, count in counts.items()) + f" to {path}.")
+
+    @blog_cli.command("import")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--batch-size", default=1000, show_default=True, help="Rows inserted per transaction.")
+    @click.option("--resume", is_flag=True, help="Carry on with an import that was interrupted.")
+    def import_command(path, batch_size, resume):
+        """Loads an export made by `flask blog export` into an empty database."""
+        try:
+            counts = import_tables(db.session, backup_tables, path, batch_size=batch_size, resume=resume,
+                                   progress=lambda table, count: click.echo(f"{table}: {count} rows imported"))
+        except BackupError as error:
+            raise click.ClickException(str(error))
+        search_index.rebuild(BlogPost, batch_size=batch_size)
+        rebuild_archive_months()
+        click.echo("Imported " + ", ".join(f"{count} {table}" for table, count in counts.items()) + f" from {path}.")
+
+    @app.cli.command("build-assets")
+    def build_assets():
+        """Rebuilds the fingerprinted, precompressed static assets into static/dist."""
+        assets.build()
+        click.echo(f"Built {len(assets.files)} assets into {assets.dist_folder}.")
+
+    @app.cli.command("rebuild-search-index")
+    @click.option("--batch-size", default=500, show_default=True, help="Posts indexed per transaction.")
+    def rebuild_search_index(batch_size):
+        """Rebuilds the full-text search index from the blog_posts table."""
+        indexed = search_index.rebuild(BlogPost, batch_size=batch_size,
+                                       progress=lambda count: click.echo(f"Indexed {count} posts"))
+        click.echo(f"Search index rebuilt with {indexed} posts.")
+
+    @app.cli.command("migrate-timestamps")
+    @click.option("--batch-size", default=1000, show_default=True, help="Rows converted per transaction.")
+    @click.option("--pause", default=0.0, show_default=True, help="Seconds to wait between batches.")
+    def migrate_timestamps_command(batch_size, pause):
+        """Fills the typed timestamp columns from the old text date columns. Safe to stop and re-run."""
+        for model, conversions in (
+                (BlogPost, {"published_at": ("date", POST_DATE_FORMAT), "edited_at": ("last_edit", POST_DATE_FORMAT)}),
+                (Comment, {"created_at": ("date_time", COMMENT_TIME_FORMAT)})):
+            table = model.__table__
+            converted, skipped = migrate_timestamps(
+                db.session, table, conversions, batch_size=batch_size, pause=pause,
+                progress=lambda done, bad: click.echo(f"{table.name}: {done} converted, {bad} unreadable"))
+            click.echo(f"{table.name}: finished with {converted} rows converted and {skipped} left unreadable.")
+        rebuild_archive_months()    # Posts that just got a published_at now count towards their month
+
+    @app.cli.command("reprocess-content")
+    @click.option("--batch-size", default=200, show_default=True, help="Rows re-rendered per transaction.")
+    def reprocess_content(batch_size):
+        """Re-renders stored post and comment HTML made by an older version of the content pipeline."""
+        for table, source, process in ((BlogPost.__table__, "body", process_post),
+                                       (Comment.__table__, "text", process_comment)):
+            updated = reprocess(db.session, table, source, process, batch_size=batch_size,
+                                progress=lambda count: click.echo(f"{table.name}: {count} rows re-rendered"))
+            click.echo(f"{table.name}: finished with {updated} rows re-rendered.")
+
+    @app.cli.command("repair-post-stats")
+    @click.option("--batch-size", default=1000, show_default=True, help="Posts recomputed per transaction.")
+    def repair_post_stats(batch_size):
+        """Recomputes every post's author name, comment count and last comment time from the source tables."""
+        posts, comments, users = BlogPost.__table__, Comment.__table__, User.__table__
+        highest_id = db.session.scalar(select(func.max(posts.c.id))) or 0
+        for start in range(0, highest_id, batch_size):
+            db.session.execute(
+                posts.update()
+                .where(posts.c.id > start, posts.c.id <= start + batch_size)
+                .values(author_name=func.coalesce(select(users.c.name).where(users.c.id == posts.c.author_id)
+                                                  .scalar_subquery(), posts.c.author_name, ""),
+                        comment_count=select(func.count()).where(comments.c.post_comment_id == posts.c.id)
+                        .scalar_subquery(),
+                        last_comment_at=select(func.max(comments.c.created_at))
+                        .where(comments.c.post_comment_id == posts.c.id).scalar_subquery()))
+            db.session.commit()
+            click.echo(f"Repaired posts up to id {min(start + batch_size, highest_id)} of {highest_id}")
+
+    @app.cli.command("rebuild-archive")
+    def rebuild_archive():
+        """Recomputes the month -> post count summary behind the archive pages."""
+        rebuild_archive_months()
+        click.echo(f"Archive rebuilt with {ArchiveMonth.query.count()} months.")
+
+    @app.cli.command("purge-sessions")
+    def purge_sessions():
+        """Deletes expired rows from the database session store."""
+        sessions = SessionRecord.__table__
+        deleted = db.session.execute(sessions.delete().where(sessions.c.expires_at <= datetime.utcnow())).rowcount
+        db.session.commit()
+        click.echo(f"Deleted {deleted} expired sessions.")
+
+    @app.cli.command("purge-outbox")
+    def purge_outbox():
+        """Deletes sent and failed emails older than MAIL_RETENTION_DAYS; the mail workers also do this when idle."""
+        click.echo(f"Deleted {outbox.prune()} old outbox messages.")
+
+    @app.cli.command("collapse-avatars")
+    @click.option("--batch-size", default=1000, show_default=True, help="Rows updated per transaction.")
+    def collapse_avatars(batch_size):
+        """Stores each user's avatar URL once, then empties the copies duplicated into every comment."""
+        users, comments = User.__table__, Comment.__table__
+        last_id = 0
+        while True:  # Users without a stored avatar URL, walked by id so every batch is its own transaction
+            rows = db.session.execute(select(users.c.id, users.c.email)
+                                      .where(users.c.avatar_url.is_(None), users.c.id > last_id)
+                                      .order_by(users.c.id).limit(batch_size)).all()
+            if not rows:
+                break
+            db.session.execute(users.update().where(users.c.id == bindparam("row_id"))
+                               .values(avatar_url=bindparam("new_avatar_url")),
+                               [dict(row_id=row.id, new_avatar_url=gravatar_url(row.email)) for row in rows])
+            db.session.commit()
+            last_id = rows[-1].id
+            click.echo(f"Stored avatars for users up to id {last_id}")
+        highest_id = db.session.scalar(select(func.max(comments.c.id))) or 0
+        for start in range(0, highest_id, batch_size):
+            db.session.execute(comments.update()
+                               .where(comments.c.id > start, comments.c.id <= start + batch_size,
+                                      comments.c.image_url != "")
+                               .values(image_url=""))
+            db.session.commit()
+            click.echo(f"Collapsed comment avatars up to id {min(start + batch_size, highest_id)} of {highest_id}")
+        user_cache.clear()
 
     @app.before_request
     def make_session_permanent():
-        """This function manages user sessions."""
-        global displayed_flash  # Indicates that the variable 'displayed_flash' is defined in the global scope
-        if not session.permanent:
-            displayed_flash = True  # Sets 'displayed_flash' to True if the session is not already marked as permanent
-        session.permanent = True  # Marks the session as permanent
-        app.permanent_session_lifetime = timedelta(minutes=15)  # Sets the lifetime of the session to 15 minutes
-        session.modified = True  # Indicates that the session has been modified
-        if displayed_flash:
-            flash(f"User session has expired. Please login again.",
-                  "warning")  # Displays a flash message to the user indicating session expiration
-            displayed_flash = False  # Resets 'displayed_flash' to False
-            return redirect(url_for("login"))  # Redirects the user to the login page
+        """Slides the session expiry forward, re-issuing the session cookie only when a refresh is due.
+
+        Visitors without a session get no cookie, and static, feed and JSON requests never touch the
+        session, so those responses carry no Set-Cookie and can be cached by proxies. A session that is left
+        idle for PERMANENT_SESSION_LIFETIME expires, and pages that need a login then redirect to it."""
+        if request.endpoint in ("static", "feed", "sitemap", "assets", "list_comments") or not session:
+            return
+        now = int(time.time())
+        if not session.permanent or now - session.get("_refreshed", 0) >= app.config['SESSION_REFRESH_AFTER']:
+            session.permanent = True  # Marks the session as permanent
+            session["_refreshed"] = now  # Changing the session is what makes Flask send the cookie again
+
+    @app.errorhandler(PasswordHasherBusy)
+    def password_hasher_busy(error):
+        """Turns requests away while the password hashing queue is full instead of letting them pile up."""
+        return error.args[0], 503, {"Retry-After": "5"}
+
+    @app.errorhandler(RateLimited)
+    def rate_limited(error):
+        """Turns away requests over a rate limit before any password hashing or email work starts."""
+        return "Too many attempts, please try again later.", 429, {"Retry-After": str(error.retry_after)}
 
     # Create a context processor to inject values into every template
     @app.context_processor
     def inject_value():
         """This function returns a dictionary of values to be used in every webpage within our Blog"""
-        return dict(dev_name=dev_name, user=current_user, year=year, logged_in=logged_in, twit=TWITTER,
-                    linkedin=LINKEDIN, github=GITHUB, resume=MY_RESUME, value=value)
+        return dict(dev_name=dev_name, user=current_user, year=year, logged_in=current_user.is_authenticated,
+                    twit=TWITTER, linkedin=LINKEDIN, github=GITHUB, resume=MY_RESUME)
 
     def admin_only(func):       # Create a decorator to restrict access to admin-only pages
         @wraps(func)
         def wrapper(*args, **kwargs):
-            if current_user.get_id() == "1":
+            if current_user.is_authenticated and current_user.is_admin:
                 return func(*args, **kwargs)
             else:
                 return abort(403)
         return wrapper
 
+    def serve_cached(key, render):
+        """Serves an anonymous GET from the rendered page cache, rendering it only on a miss.
+
+        `render` returns the page HTML and the cache tags of the content it shows. Responses carry an
+        ETag and Last-Modified header, so a browser revalidating an unchanged page gets a 304 and the
+        page is neither queried nor rendered."""
+        if current_user.is_authenticated or request.method not in ("GET", "HEAD"):
+            return render()[0]
+        entry = page_cache.get(key)
+        if entry is None:
+            html, tags = render()
+            entry = page_cache.set(key, html, tags)
+        response = make_response(entry.body)
+        response.set_etag(entry.etag)
+        response.last_modified = entry.last_modified
+        response.cache_control.no_cache = True  # Browsers may keep the page but must revalidate it
+        return response.make_conditional(request)
+
+    def fetch_feed_page(before=None, per_page=None, criteria=()):
+        """Returns one page of the homepage feed, newest first, and the cursor of the next (older) page.
+
+        Pages are keyed on the post id (ids grow with publication order), so each page costs a single
+        indexed range query no matter how deep the reader pages. Only the columns shown on the homepage
+        are loaded, author name and comment count included, so the page needs no other query and the
+        post body is never read. `criteria` narrows the feed, e.g. to one month or one author."""
+        per_page = per_page or app.config['POSTS_PER_PAGE']
+        query = (BlogPost.query
+                 .options(load_only(BlogPost.id, BlogPost.author_id, BlogPost.title, BlogPost.subtitle, BlogPost.date,
+                                    BlogPost.last_edit, BlogPost.published_at, BlogPost.edited_at,
+                                    BlogPost.author_name, BlogPost.comment_count, BlogPost.reading_time))
+                 .filter(*criteria)
+                 .order_by(BlogPost.id.desc()))
+        if before is not None:
+            query = query.filter(BlogPost.id < before)
+        posts = query.limit(per_page + 1).all()  # One extra row tells us whether an older page exists
+        next_cursor = posts[per_page - 1].id if len(posts) > per_page else None
+        return posts[:per_page], next_cursor
+
+    def archive_months():
+        """The months that have posts, newest first, read from the archive_months summary in one query."""
+        return (ArchiveMonth.query.filter(ArchiveMonth.post_count > 0)
+                .order_by(ArchiveMonth.year.desc(), ArchiveMonth.month.desc()).all())
+
+    def count_archive_month(published_at, change):
+        """Adds `change` to the post count of the month `published_at` falls in, within the current transaction."""
+        if published_at is None:
+            return
+        months = ArchiveMonth.__table__
+        if change < 0:  # The month was counted when the post was published, so its row exists
+            in_month = (months.c.year == published_at.year) & (months.c.month == published_at.month)
+            db.session.execute(months.update().where(in_month).values(post_count=months.c.post_count + change))
+            return
+        # A single upsert, so two writers starting the same month cannot both try to insert it
+        insert = UPSERT_INSERTS[db.session.get_bind().dialect.name]
+        db.session.execute(insert(months).values(year=published_at.year, month=published_at.month, post_count=change)
+                           .on_conflict_do_update(index_elements=[months.c.year, months.c.month],
+                                                  set_={"post_count": months.c.post_count + change}))
+
+    def render_feed_page(before, tags, criteria=(), **context):
+        """Renders one page of posts with the archive links; returns the HTML and its cache tags."""
+        posts, next_cursor = fetch_feed_page(before=before, criteria=criteria)
+        html = render_template("index.html", all_posts=posts, current_user=current_user, next_cursor=next_cursor,
+                               is_first_page=before is None, archive_months=archive_months(), **context)
+        # An edit or comment only affects the pages showing that post
+        return html, tags + ["archive"] + [tag for post in posts for tag in (f"post:{post.id}", f"comments:{post.id}")]
+
     @app.route('/')     # Define a route to display all the blog posts
+    @read_only
     def get_all_posts():
-        posts = BlogPost.query.all()  # returns the number of records(posts) in the database as a list.
-        posts.sort(key=lambda r: r.date)  # sorts the list returned above by date
-        return render_template("index.html", all_posts=posts, current_user=current_user)
+        before = request.args.get("before", type=int)  # Keyset cursor: id of the last post on the previous page
+        # A new or deleted post shifts every feed page
+        return serve_cached(("feed", before), lambda: render_feed_page(before, ["feed"]))
+
+    @app.route("/archive/<int:year>/<int:month>")
+    @read_only
+    def archive(year, month):
+        """The posts published in one month, newest first, found through the published_at index."""
+        if not 1 <= month <= 12 or not 1 <= year < 9999:
+            abort(404)
+        before = request.args.get("before", type=int)
+        start, end = datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1)
+        return serve_cached(("archive", year, month, before), lambda: render_feed_page(
+            before, [], criteria=(BlogPost.published_at >= start, BlogPost.published_at < end),
+            heading=start.strftime("%B %Y"), subheading=f"Posts published in {start:%B %Y}.",
+            pager_endpoint="archive", pager_args=dict(year=year, month=month)))
+
+    @app.route("/author/<int:user_id>")
+    @read_only
+    def author(user_id):
+        """The posts written by one author, newest first, found through the author_id index."""
+        before = request.args.get("before", type=int)
+
+        def render():
+            name = db.session.scalar(select(User.name).where(User.id == user_id))
+            if name is None:
+                abort(404)
+            return render_feed_page(before, [f"author:{user_id}"], criteria=(BlogPost.author_id == user_id,),
+                                    heading=name, subheading=f"Posts written by {name}.",
+                                    pager_endpoint="author", pager_args=dict(user_id=user_id))
+
+        return serve_cached(("author", user_id, before), render)
+
+    def normalize_email(email):
+        """Returns the canonical form emails are stored and looked up in."""
+        return (email or "").strip().lower()
+
+    def find_user_by_email(email):
+        """Returns the user registered with `email` through the unique email index, or None."""
+        return User.query.filter_by(email=normalize_email(email)).first()
+
+    def is_safe_next_route(target):
+        """Only local paths are followed after login, never another site."""
+        return bool(target) and target.startswith("/") and not target.startswith("//")
+
+    def hash_reset_code(code):
+        return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+    def active_password_reset():
+        """Returns the unexpired, unused password reset started in this browser session, or None."""
+        reset_id = session.get("password_reset_id")
+        if reset_id is None:
+            return None
+        reset = db.session.get(PasswordReset, reset_id)
+        if reset is None or reset.used_at is not None or reset.expires_at <= datetime.utcnow():
+            return None
+        return reset
 
     def validate_email(email):      # Define a function to validate an email address during registration
-        if User.query.filter_by(email=email).first():
+        if find_user_by_email(email):
             raise ValidationError("You have already signed up with that email, login instead!")
 
+    comment_posted = threading.Condition()
+
     @login_required
-    def post_comment(new_remark, post_id, url, date_time):    # Define a function to handle adding new comments to posts
+    def post_comment(new_remark, post_id, created_at):    # Define a function to handle adding new comments to posts
         remark = Comment(
             commenter_id=current_user.id,
             post_comment_id=post_id,
             text=new_remark.comment.data,
-            image_url=url,
-            date_time=date_time
+            **process_comment(new_remark.comment.data),    # Stores the sanitized HTML served on page views
+            image_url="",    # The avatar is read from the commenter's row instead of copied into every comment
+            date_time=created_at.strftime(COMMENT_TIME_FORMAT),    # Still written while older code may read it
+            created_at=created_at
         )
         db.session.add(remark)
+        # A plain table UPDATE, so a comment does not bump the post's version and clash with an open editor
+        posts = BlogPost.__table__
+        db.session.execute(posts.update().where(posts.c.id == post_id)
+                           .values(comment_count=posts.c.comment_count + 1, last_comment_at=created_at))
         db.session.commit()
+        page_cache.invalidate(f"comments:{post_id}")
+        with comment_posted:
+            comment_posted.notify_all()     # Wakes this process's long-polling comment requests
+        return remark
+
+    def fetch_comment_page(post_id, after=None, per_page=None):
+        """Returns one page of a post's comments, oldest first, and the cursor of the next page.
+
+        Comments are looked up through the post_comment_id index with the commenter joined in, so a post
+        page costs the same number of queries however many comments the site holds."""
+        per_page = per_page or app.config['COMMENTS_PER_PAGE']
+        query = (Comment.query
+                 .filter(Comment.post_comment_id == post_id)
+                 .join(Comment.commenter)
+                 .options(contains_eager(Comment.commenter).load_only(User.id, User.name, User.email, User.avatar_url))
+                 .order_by(Comment.id))
+        if after is not None:
+            query = query.filter(Comment.id > after)
+        comments = query.limit(per_page + 1).all()  # One extra row tells us whether more comments exist
+        next_cursor = comments[per_page - 1].id if len(comments) > per_page else None
+        return comments[:per_page], next_cursor
 
     @login_manager.user_loader      # Define a function to load a user from the user_id
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        """Serves current_user from the per-process user cache, querying the user row only on a miss."""
+        user = user_cache.get(int(user_id))
+        if user is None:
+            row = db.session.get(User, int(user_id))
+            user = user_cache.set(row) if row is not None else None
+        return user
 
 
     @app.route('/register', methods=["GET", "POST"])
+    @rate_limiter.limit("register")
     def register():
         """Route to register page"""
-        global logged_in  # Declare `logged_in` as a global variable
+        logged_in = False
         register_user = RegisterForm()  # Create a `RegisterForm` object
         if register_user.validate_on_submit():  # Check if the form was submitted
             try:
@@ -199,19 +838,22 @@ with app.app_context():
                 new_user.name = request.form.get(
                     "name").title()  # Retrieve the name from the form, capitalize it, and set it as the user's name
                 # Retrieve the email from the form, remove any leading/trailing whitespaces, convert it to lowercase and set it as the user's email
-                new_user.email = request.form.get("email").strip().lower()
+                new_user.email = normalize_email(request.form.get("email"))
                 validate_email(email=new_user.email)  # Validate the email address
                 password = request.form.get("password")  # Retrieve the password from the form
                 if password in new_user.email:  # Check if the password is the same as the email
                     logged_in = False  # Set `logged_in` to False
                 else:
-                    # Hash the password using the `generate_password_hash` function from the `werkzeug.security` module and set it as the user's password
-                    new_user.password = generate_password_hash(password, method="pbkdf2:sha256", salt_length=8)
+                    # Hash the password off the request thread under the configured policy and set it as the user's password
+                    new_user.password = password_hasher.hash(password)
                     db.session.add(new_user)  # Add the new user to the database
                     db.session.commit()  # Commit the changes to the database
+                    user_cache.invalidate(new_user.id)  # Drops any stale entry left under a reused id
                     login_user(new_user)  # Log in the new user
                     logged_in = True  # Set `logged_in` to True
                     make_session_permanent()
+            except PasswordHasherBusy:
+                raise  # Answered with a 503 by `password_hasher_busy`
             except Exception as e:  # Catch any exceptions
                 flash(e.args[0], "error")  # Flash the error message
                 return redirect(url_for("login"))  # Redirect to the login page
@@ -226,146 +868,122 @@ with app.app_context():
 
     # Route that handles user login, accepts GET and POST requests.
     @app.route('/login', methods=["GET", "POST"])
+    @rate_limiter.limit("login")
     def login():
-        # Declare variables for later use
-        global logged_in, next_route
         # Initialize an instance of the login form
         login_form = LoginForm()
-        # Declare and initialize valid_email as False to validate input email
-        valid_email = False
-        # Check if there is a "next" query parameter and assign the value to next_route
-        if request.args.get("next"):
-            next_route = request.args.get('next')
+        # Remember a "next" query parameter in the session so it survives the form submission
+        if is_safe_next_route(request.args.get("next")):
+            session["next_route"] = request.args.get('next')
         # Validate login form upon submission
         if login_form.validate_on_submit():
-            # Extract user email and password from form data
-            user_email = request.form.get("email").strip().lower()
+            # Look up the user by the submitted email and extract the password from form data
+            user = find_user_by_email(request.form.get("email"))
             user_pw = request.form.get("password")
-            # Query all users in the database
-            users = User.query.all()
-            # Check email validity and password match
-            for user in users:
-                if user_email == user.email:
-                    valid_email = True
-                    # If the password matches, set logged_in as True, log in the user, and redirect to next route or homepage
-                    if check_password_hash(user.password, user_pw):
-                        logged_in = True
-                        login_user(user)
-                        make_session_permanent()
-                        return redirect(next_route or url_for('get_all_posts'))
-                    else:
-                        # If password does not match, set logged_in as False
-                        logged_in = False
-                elif user_email in [user.email for user in users]:
-                    valid_email = True
-                else:
-                    valid_email = False
-            # Flash messages based on login result
-            if logged_in:
-                flash('You were successfully logged in', 'info')
-            elif valid_email and not logged_in:
-                flash("Password incorrect, please try again.", "error")
-                return redirect("/login")
-            elif not valid_email:
+            if user is None:
                 flash("This email does not exist, please try again.", "error")
                 return redirect("/login")   # Redirect to the login page
+            # If the password matches, log in the user and redirect to next route or homepage
+            if password_hasher.verify(user.password, user_pw):
+                if password_hasher.needs_rehash(user.password):
+                    # Upgrades a hash made under an older policy while we still have the plain password
+                    try:
+                        user.password = password_hasher.hash(user_pw)
+                        db.session.commit()
+                    except PasswordHasherBusy:
+                        pass    # The password was right; the upgrade waits for a quieter login
+                login_user(user)
+                make_session_permanent()
+                return redirect(session.pop("next_route", None) or url_for('get_all_posts'))
+            flash("Password incorrect, please try again.", "error")
+            return redirect("/login")
         # Render the login template with login form as argument
         return render_template("login.html", form=login_form)
 
     # Route for logging out user
     @app.route('/logout')
     def logout():
-        global logged_in
         # Check if user is authenticated
         if current_user.is_authenticated:
-            # Log out user and set logged_in as False
+            # Log out user
             logout_user()
-            logged_in = False
 
         # Redirect to homepage
         return redirect(url_for('get_all_posts'))
 
 
     @app.route("/forgot_pass", methods=["GET", "POST"])
+    @rate_limiter.limit("forgot_password")
     def forgot_password():
         """This method handles password reset"""
-        global random_password, forgot_pass, reset_user, value, email_exists
-        # Initialize variables
-        user_name = None
         verify_email = ForgotPasswordForm()  # Create an instance of the ForgotPasswordForm
-        value = verify_email.email.label
-        forgot_pass = True
-        # Retrieve all users from the User table
-        users = User.query.all()
         if verify_email.validate_on_submit():  # Check if the form is submitted and valid
-            user_email = request.form.get("email").strip().lower()  # Retrieve the email from the form
+            user_email = normalize_email(request.form.get("email"))  # Retrieve the email from the form
             # Check if the user email exists in the database
-            for user in users:
-                print(user_email, user.email)
-                if user_email == user.email:
-                    reset_user = user.id  # Store the ID of the user to be reset
-                    user_name = user.name  # Store the name of the user
-                    email_exists = True
-                    break
-                else:
-                    email_exists = False
-
-            if email_exists:  # If the email exists in the database
-                random_password = str(os.urandom(24))  # Generate a random password
-                print(random_password)
-
-                # Send an email with the password reset information
-                with smtplib.SMTP(host="smtp.office365.com:587") as connection:
-                    connection.starttls()
-                    connection.login(user=MY_EMAIL, password=MY_PASS)
-                    connection.sendmail(from_addr=MY_EMAIL, to_addrs=[user_email, ANOTHER_EMAIL],
-                                        msg=f"Subject: {user_name}, Did you request a password reset on {dev_name}'s blog?\n\n"
-                                            f"Hello {user_name}, someone tried to reset your password.\n"
-                                            f"If you requested a password reset on {dev_name}'s blog, "
-                                            "copy the code below and paste it in the 'Verify Password' page.\n"
-                                            "\n"
-                                            f"{random_password}\n"
-                                            "\n"
-                                            f"Otherwise, you can either ignore this email or notify the admin."
-                                            f"\n"
-                                            f"Regards,\n"
-                                            f"Python AI")
+            user = find_user_by_email(user_email)
+            if user is not None:  # If the email exists in the database
+                reset_code = secrets.token_urlsafe(18)  # Generate a random one-time code
+                # Store only a hash of the code, with an expiry, so any server process can check it
+                reset = PasswordReset(user_id=user.id, code_hash=hash_reset_code(reset_code),
+                                      created_at=datetime.utcnow(),
+                                      expires_at=datetime.utcnow() + app.config['PASSWORD_RESET_TTL'])
+                db.session.add(reset)
+                db.session.commit()
+                session["password_reset_id"] = reset.id  # Ties the reset to this browser session
+
+                # Queue an email with the password reset information for the background mail workers
+                outbox.enqueue(from_addr=MY_EMAIL, to_addrs=[user_email, ANOTHER_EMAIL],
+                               msg=f"Subject: {user.name}, Did you request a password reset on {dev_name}'s blog?\n\n"
+                                   f"Hello {user.name}, someone tried to reset your password.\n"
+                                   f"If you requested a password reset on {dev_name}'s blog, "
+                                   "copy the code below and paste it in the 'Verify Password' page.\n"
+                                   "\n"
+                                   f"{reset_code}\n"
+                                   "\n"
+                                   f"Otherwise, you can either ignore this email or notify the admin."
+                                   f"\n"
+                                   f"Regards,\n"
+                                   f"Python AI")
 
                 return redirect(url_for('verify_password'))  # Redirect to the verify_password route
             else:
                 flash("The email you provided does not exist in the database")  # Flash an error message
                 return redirect(url_for("login"))  # Redirect to the login route
-        return render_template("forgot-password.html", verify_email=verify_email, forgot_pass=forgot_pass,
-                               email_exists=email_exists, verified=user_verified, user_id=reset_user)
+        return render_template("forgot-password.html", verify_email=verify_email, forgot_pass=True,
+                               value=verify_email.email.label)
 
     @app.route("/verify", methods=["GET", "POST"])
     def verify_password():
-        global user_verified, value, email_exists
         verify_code = VerifyCodeForm()  # Create an instance of the VerifyCodeForm
-        value = verify_code.code.label
+        reset = active_password_reset()  # The reset started by this browser session, if still valid
         if verify_code.validate_on_submit():  # Check if the form is submitted and valid
             reset_code = request.form.get("code")  # Retrieve the verification code from the form
-            if email_exists:  # If the email exists in the database,
-                if reset_code == random_password:  # Check if the verification code matches the generated password
-                    user_verified = True
-                    email_exists = False
-                    return redirect(url_for("replace_password"))  # Redirect to the replace_password route
-                else:
-                    user_verified = False
-                    flash("The code you provided is incorrect")
-                    return redirect(url_for("login"))
-        return render_template("forgot-password.html", verified=user_verified, random_code=random_password,
-                               email_exists=email_exists, verify_code=verify_code)
+            if reset is None:
+                flash("Your password reset has expired, please request a new code")
+                return redirect(url_for("forgot_password"))
+            # Check if the verification code matches the emailed one
+            if hmac.compare_digest(hash_reset_code(reset_code), reset.code_hash):
+                reset.verified_at = datetime.utcnow()
+                db.session.commit()
+                return redirect(url_for("replace_password"))  # Redirect to the replace_password route
+            else:
+                flash("The code you provided is incorrect")
+                return redirect(url_for("login"))
+        return render_template("forgot-password.html", email_exists=reset is not None and reset.verified_at is None,
+                               verify_code=verify_code, value=verify_code.code.label)
 
     @app.route("/change_pass", methods=["GET", "POST"])
     def replace_password():
         """This method gets the new password from the existing user and updates the user record in the database"""
-        global value, reset_user, logged_in
+        logged_in = False
         change_pass = ChangePasswordForm()  # Create an instance of the ChangePasswordForm class
-        value = change_pass.password.label  # Assign the label of the password field to the 'value' variable
+        reset = active_password_reset()  # The reset started by this browser session, if still valid
+        user_verified = reset is not None and reset.verified_at is not None
         if change_pass.validate_on_submit():  # Check if the form was submitted and all validators passed
-            user = User.query.get(reset_user)  # Retrieve the User object associated with the reset_user ID
-            print(user.email, user.name)  # Print the email and name of the user for debugging purposes
+            if not user_verified:
+                flash("Your password reset has expired, please request a new code")
+                return redirect(url_for("forgot_password"))
+            user = reset.user  # Retrieve the User object the reset was requested for
 
             try:
                 password = request.form.get("password")  # Retrieve the password from the form
@@ -373,27 +991,19 @@ with app.app_context():
                 if password in user.email:  # Check if the password is the same as the email
                     logged_in = False  # Set 'logged_in' flag to False since the password is invalid
                 else:
-                    # Delete the existing user record from the database
-                    db.session.delete(user)
-                    db.session.commit()
-
-                    # Hash the password using the `generate_password_hash` function from the `werkzeug.security` module
-                    # and set it as the user's password
-                    edit_user_record = User()
-                    user_password = generate_password_hash(password, method="pbkdf2:sha256", salt_length=8)
-                    edit_user_record.id = reset_user
-                    edit_user_record.email = user.email
-                    edit_user_record.name = user.name
-                    edit_user_record.password = user_password
-
-                    # Add the updated user record to the database
-                    db.session.add(edit_user_record)
+                    # Hash the new password off the request thread and update the existing user record in place
+                    user.password = password_hasher.hash(password)
+                    reset.used_at = datetime.utcnow()  # A reset code can only be used once
                     db.session.commit()
+                    user_cache.invalidate(user.id)
+                    session.pop("password_reset_id", None)
 
-                    login_user(edit_user_record)  # Log in the new user
+                    login_user(user)  # Log in the user
                     logged_in = True  # Set 'logged_in' flag to True
                     make_session_permanent()  # Make the user session permanent
 
+            except PasswordHasherBusy:
+                raise  # Answered with a 503 by `password_hasher_busy`
             except Exception as e:  # Catch any exceptions that occur
                 flash(e.args[0], "error")  # Flash the error message
                 return redirect(url_for("login"))  # Redirect to the login page
@@ -405,30 +1015,98 @@ with app.app_context():
                     flash("Invalid password provided!", "warning")  # Flash the warning message
                     return redirect(url_for("login"))  # Redirect to the login page
         # Render the 'forgot-password.html' template with the necessary data
-        return render_template("forgot-password.html", verified=user_verified, change_pass=change_pass)
+        return render_template("forgot-password.html", verified=user_verified, change_pass=change_pass,
+                               value=change_pass.password.label)
 
     # Route for displaying blog post and comments
     @app.route("/post/<int:post_id>", methods=["GET", "POST"])
+    @read_only     # Only its GET requests are sent to the replica
     def show_post(post_id):
         """Displays each article including the comments"""
-        gravatar_url = None    # Declare `gravatar_url` and set it to None
-        today = datetime.now().strftime("%d %b %Y")    # Get the current date and format it
-        requested_post = BlogPost.query.get(post_id)    # Get the blog post with the given ID
-        comments = Comment.query.all()    # Load all comments from the database
-        new_comment = CommentForm()    # Create a new `CommentForm` object
-        if current_user.is_authenticated:    # Check if the user is authenticated
-            gravatar = Gravatar(current_user.email)    # Create a new `Gravatar` object with the user's email
-            gravatar_url = gravatar.get_image()    # Get the user's gravatar URL
-        if new_comment.validate_on_submit():    # Check if the form was submitted
+        today = date.today()    # Comment times are shown differently on the day they were made
+        after = request.args.get("after", type=int)    # Keyset cursor: id of the last comment already shown
+        # The form is only built when it is used: its CSRF token would start a session for anonymous readers
+        new_comment = CommentForm() if request.method == "POST" or current_user.is_authenticated else None
+        if new_comment is not None and new_comment.validate_on_submit():    # Check if the form was submitted
             if current_user.is_authenticated:    # Check if the user is authenticated
-                date_time = datetime.now().strftime("%H:%M  .  %d %b %Y")    # Get the current date and time
-                post_comment(new_comment, post_id, gravatar_url, date_time)
+                post_comment(new_comment, post_id, datetime.now())
                 return redirect(url_for("show_post", post_id=post_id))
             else:
                 flash("Kindly login to post your comment", "error")
                 return redirect(url_for('login'))
-        return render_template("post.html", form=new_comment, post=requested_post, current_user=current_user,
-                               comments=comments, gravatar=gravatar_url, current_date=today)
+
+        def render():
+            # Get the blog post with the given ID along with its author
+            requested_post = BlogPost.query.options(joinedload(BlogPost.author)).filter_by(id=post_id).first_or_404()
+            comments, next_cursor = fetch_comment_page(post_id, after=after)    # Load this post's comments only
+            html = render_template("post.html", form=new_comment, post=requested_post, current_user=current_user,
+                                   comments=comments, next_cursor=next_cursor, is_first_page=after is None,
+                                   description=requested_post.excerpt)
+            return html, [f"post:{post_id}", f"comments:{post_id}"]
+
+        # Today's date is part of the key because the rendered comment times depend on it
+        return serve_cached(("post", post_id, after, today), render)
+
+    @app.route("/post/<int:post_id>/comments")
+    @read_only
+    def list_comments(post_id):
+        """Returns a post's comments newer than the `after` cursor as JSON.
+
+        With `wait=<seconds>` (capped at COMMENTS_LONG_POLL_MAX, 0 unless long-polling is enabled) the request
+        is held open until a comment arrives, rechecking every COMMENTS_POLL_INTERVAL seconds so comments saved
+        by other worker processes are picked up too. The database connection is handed back to the pool while
+        the request waits."""
+        after = request.args.get("after", 0, type=int)
+        wait = min(max(request.args.get("wait", 0, type=float), 0), app.config['COMMENTS_LONG_POLL_MAX'])
+        deadline = time.monotonic() + wait
+        while True:
+            comments, next_cursor = fetch_comment_page(post_id, after=after)
+            remaining = deadline - time.monotonic()
+            if comments or remaining <= 0:
+                break
+            db.session.close()
+            with comment_posted:
+                comment_posted.wait(min(remaining, app.config['COMMENTS_POLL_INTERVAL']))
+        return jsonify(comments=comments, cursor=comments[-1].id if comments else after,
+                       more=next_cursor is not None)
+
+    @app.route("/post/<int:post_id>/comments", methods=["POST"])
+    def add_comment(post_id):
+        """Saves a comment and returns only that comment as JSON, so the post page can append it in place."""
+        if not current_user.is_authenticated:
+            return jsonify(error="Kindly login to post your comment"), 401
+        new_comment = CommentForm()
+        if not new_comment.validate_on_submit():
+            return jsonify(errors=new_comment.errors), 400
+        if db.session.scalar(select(BlogPost.id).where(BlogPost.id == post_id)) is None:
+            abort(404)
+        remark = post_comment(new_comment, post_id, datetime.now())
+        return jsonify(remark), 201
+
+    @app.route("/search")
+    def search():
+        """Ranked full-text search over post titles, subtitles and bodies"""
+        query = request.args.get("q", "").strip()
+        page = max(request.args.get("page", 1, type=int), 1)
+        results, has_more = search_index.search(query, page=page, per_page=app.config['POSTS_PER_PAGE'])
+        return render_template("search.html", query=query, results=results, page=page, has_more=has_more)
+
+    @app.route("/feed.xml")
+    def feed():
+        """Atom feed of the newest posts, served from memory"""
+        return syndication.serve("feed")
+
+    @app.route("/sitemap.xml")
+    def sitemap():
+        """Sitemap of every post, served from memory"""
+        return syndication.serve("sitemap")
+
+    @app.route("/metrics")
+    @login_required
+    @admin_only
+    def metrics():
+        """Prometheus text exposition of this process's request, SQL, SMTP and hashing metrics"""
+        return registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
     @app.route("/about")
     def about():
@@ -437,32 +1115,30 @@ with app.app_context():
 
 
     @app.route("/contact", methods=["GET", "POST"])
+    @rate_limiter.limit("contact")
     def contact():
         """Blogger's contact details and mailto:"""
         # This function handles GET and POST requests for the "contact" page.
-        # If the request is a POST request (i.e. the user has submitted a form), it sends an email
-        # with the user's message using SMTP protocol.
+        # If the request is a POST request (i.e. the user has submitted a form), it queues an email
+        # with the user's message for the background mail workers.
         if request.method == "POST":
             # retrieve the user's data from the contact form
             user = request.form.get("name")
             email = request.form.get("email")
             mobile = request.form.get("phone")
             message = request.form.get("message")
-            # send an email using SMTP protocol
-            with smtplib.SMTP(host="smtp.office365.com:587") as connection:
-                connection.starttls()
-                connection.login(user=MY_EMAIL, password=MY_PASS)
-                connection.sendmail(from_addr=MY_EMAIL, to_addrs=mail_list,
-                                    msg=f"Subject: Notification from {user.title()} with email {email}.\n\n"
-                                        f"Hello {dev_name.title()}, {user.title()} has left you a message.\n"
-                                        f"Details below:\n"
-                                        f"Name: {user.title()}\n"
-                                        f"Email: {email}\n"
-                                        f"Mobile: {mobile}\n"
-                                        f"Message: {message}\n"
-                                        f"\n"
-                                        f"Regards,\n"
-                                        f"Python AI")
+            # queue the email; it is sent over SMTP in the background
+            outbox.enqueue(from_addr=MY_EMAIL, to_addrs=mail_list,
+                           msg=f"Subject: Notification from {user.title()} with email {email}.\n\n"
+                               f"Hello {dev_name.title()}, {user.title()} has left you a message.\n"
+                               f"Details below:\n"
+                               f"Name: {user.title()}\n"
+                               f"Email: {email}\n"
+                               f"Mobile: {mobile}\n"
+                               f"Message: {message}\n"
+                               f"\n"
+                               f"Regards,\n"
+                               f"Python AI")
         # render the "contact" page
         return render_template("contact.html")
 
@@ -471,7 +1147,6 @@ with app.app_context():
     @login_required  # Requires user login to edit post
     @admin_only
     def add_new_post():
-        global editing
         editing = False
         # create a form for creating a new blog post
         form = CreatePostForm()
@@ -479,14 +1154,22 @@ with app.app_context():
         if form.validate_on_submit():
             new_post = BlogPost(
                 author_id=current_user.id,
+                author_name=current_user.name,
                 title=form.title.data,
                 subtitle=form.subtitle.data,
                 body=form.body.data,
+                **process_post(form.body.data),    # Sanitized HTML, excerpt and reading time
                 img_url=form.img_url.data,
-                date=date.today().strftime("%B %d, %Y")
+                date=date.today().strftime(POST_DATE_FORMAT),
+                published_at=datetime.now()
             )
             db.session.add(new_post)
+            db.session.flush()  # Assigns the post id needed by the search index
+            search_index.index_post(new_post)
+            count_archive_month(new_post.published_at, 1)
             db.session.commit()
+            page_cache.invalidate("feed", "archive", f"author:{new_post.author_id}")
+            syndication.post_saved(new_post)
             # redirect to the page that displays all the blog posts
             return redirect(url_for("get_all_posts"))
         # render the "make-post" page with the form
@@ -497,14 +1180,9 @@ with app.app_context():
     @login_required  # Requires user login to edit post
     @admin_only  # Requires user to have admin privileges to edit post
     def edit_post(post_id):
-        global editing  # Uses a global variable to keep track of editing state
         editing = True
         # Retrieves the blog post to be edited from the database
-        post = BlogPost.query.get(post_id)
-        all_comments = Comment.query.all()
-        affected_comments = [comment for comment in all_comments if comment.post_comment_id == post_id]
-        date_of_post = post.date  # Gets the date of the post before editing
-        blog_id = post.id  # Gets the ID of the post before editing
+        post = BlogPost.query.get_or_404(post_id)
         # Creates a form object with pre-filled fields based on the current post
         edit_form = CreatePostForm(
             title=post.title,
@@ -512,46 +1190,40 @@ with app.app_context():
             img_url=post.img_url,
             author=current_user,
             body=post.body,
-            last_edit=date.today().strftime("%B %d, %Y")
+            version=post.version    # Remembers which revision of the post the editor started from
         )
         # Disables the 'title' and 'author' fields so that they cannot be edited
         edit_form.title.render_kw = {'readonly': True}
         edit_form.author.render_kw = {'readonly': True}
         if edit_form.validate_on_submit():  # Validates the edited form
-            # Deletes the old post from the database
-            db.session.delete(post)
-            for comment in affected_comments:
-                db.session.delete(comment)
-            db.session.commit()
-            # Creates a new blog post with updated information
-            edit_record = BlogPost(
-                id=blog_id,     # Sets the ID of the updated post to the ID of the old post
-                author_id=current_user.id,
-                title=edit_form.title.data,
-                subtitle=edit_form.subtitle.data,
-                date=date_of_post,  # Uses the original post's date
-                body=edit_form.body.data,
-                img_url=edit_form.img_url.data,
-                last_edit=date.today().strftime("%B %d, %Y")
-            )
-            # Adds the updated post to the database
-            # edit_record.id = blog_id
-            db.session.add(edit_record)
-            for comment in affected_comments:
-                comment_to_add = Comment(
-                    id=comment.id,
-                    commenter_id=comment.commenter_id,
-                    post_comment_id=comment.post_comment_id,
-                    text=comment.text,
-                    image_url=comment.image_url,
-                    date_time=comment.date_time
-                )
-                db.session.add(comment_to_add)
-                print(f"Comment ID = {comment.id}")
-            db.session.commit()
-            print(edit_record.id, blog_id)
+            # Refuses to overwrite changes saved by someone else since this editor loaded the post
+            if edit_form.version.data != str(post.version):
+                flash("This post was changed while you were editing it. Please review it and try again.", "warning")
+                return redirect(url_for("edit_post", post_id=post_id))
+            # Updates the changed columns of the post in place; its comments are left untouched
+            previous_author_id = post.author_id
+            post.author_id = current_user.id
+            post.author_name = current_user.name
+            post.title = edit_form.title.data
+            post.subtitle = edit_form.subtitle.data
+            post.body = edit_form.body.data
+            for column, value in process_post(post.body).items():    # Re-renders the stored HTML with the new body
+                setattr(post, column, value)
+            post.img_url = edit_form.img_url.data
+            post.last_edit = date.today().strftime(POST_DATE_FORMAT)
+            post.edited_at = datetime.now()
+            try:
+                search_index.index_post(post)   # Flushes the UPDATE first, so a stale edit is caught here too
+                db.session.commit()     # A single UPDATE ... WHERE version = <version loaded>
+            except StaleDataError:
+                db.session.rollback()
+                flash("This post was changed while you were editing it. Please review it and try again.", "warning")
+                return redirect(url_for("edit_post", post_id=post_id))
+            # Its month is unchanged, so only the pages listing this post, and the authors' pages, go stale
+            page_cache.invalidate(f"post:{post_id}", f"author:{previous_author_id}", f"author:{post.author_id}")
+            syndication.post_saved(post)
             # Redirects the user to the updated post
-            return redirect(url_for("show_post", post_id=edit_record.id))
+            return redirect(url_for("show_post", post_id=post_id))
         # Renders the 'make-post.html' template with the pre-filled form and editing state
         return render_template("make-post.html", form=edit_form, is_edit=editing, post=post)
 
@@ -561,19 +1233,27 @@ with app.app_context():
     @login_required  # Requires user login to delete post
     @admin_only  # Requires user to have admin privileges to delete post
     def delete_post(post_id):
-        # Retrieves the blog post to be deleted from the database
-        post_to_delete = BlogPost.query.get(post_id)
-        # Deletes the post from the database
-        all_comments = Comment.query.all()
-        affected_comments = [comment for comment in all_comments if comment.post_comment_id == post_id]
-        print(affected_comments)
-        for comment in affected_comments:
-            db.session.delete(comment)
-        db.session.delete(post_to_delete)
+        doomed = db.session.execute(select(BlogPost.published_at, BlogPost.author_id)
+                                    .where(BlogPost.id == post_id)).first()
+        if doomed is None:
+            abort(404)
+        # Deletes the post's comments and then the post itself with one bulk DELETE each, in a single transaction
+        Comment.query.filter_by(post_comment_id=post_id).delete(synchronize_session=False)
+        search_index.remove_post(post_id)
+        deleted = BlogPost.query.filter_by(id=post_id).delete(synchronize_session=False)
+        if not deleted:
+            db.session.rollback()
+            abort(404)
+        count_archive_month(doomed.published_at, -1)
         db.session.commit()
+        page_cache.invalidate("feed", "archive", f"post:{post_id}", f"author:{doomed.author_id}")
+        syndication.post_deleted(post_id)
         # Redirects the user to the page displaying all blog posts
         return redirect(url_for('get_all_posts'))
 
+    return app
+
+
 if __name__ == "__main__":
     # Runs the Flask app on the local machine
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
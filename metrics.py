@@ -0,0 +1,221 @@
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the per-request query count histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(list(zip(self.labelnames, key)))} {_format_number(value)}"
+
+
+class Gauge(Counter):
+    """A value that can go up and down; set() replaces it."""
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Counter):
+    """Counts observations into cumulative buckets and keeps their sum, optionally split by labels."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observed = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value, observed + 1)
+
+    def time(self, **labels):
+        """Context manager observing how long its block took, in seconds."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total, observed))
+                            for key, (counts, total, observed) in self._values.items())
+        for key, (counts, total, observed) in values:
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket{_format_labels(labels + [('le', _format_number(float(bound)))])} {count}"
+            yield f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {observed}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_number(total)}"
+            yield f"{self.name}_count{_format_labels(labels)} {observed}"
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    """Holds every metric of the process and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, *args, **kwargs):
+        return self._add(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self._add(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self._add(Histogram(*args, **kwargs))
+
+    def on_collect(self, func):
+        """Registers `func` to run before each scrape, e.g. to copy cache statistics into gauges."""
+        self._collectors.append(func)
+        return func
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        for collect in self._collectors:
+            collect()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Time spent handling a request.", ["endpoint", "method", "status"])
+REQUEST_QUERIES = registry.histogram(
+    "http_request_db_queries", "SQL statements executed while handling a request.", ["endpoint"],
+    buckets=QUERY_COUNT_BUCKETS)
+REQUEST_QUERY_TIME = registry.histogram(
+    "http_request_db_seconds", "Time spent in SQL statements while handling a request.", ["endpoint"])
+QUERY_LATENCY = registry.histogram("db_query_duration_seconds", "Time taken by each SQL statement.")
+SLOW_QUERIES = registry.counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS.")
+SMTP_SEND_LATENCY = registry.histogram(
+    "smtp_send_duration_seconds", "Time taken to hand one email to the SMTP server.", ["outcome"])
+PASSWORD_HASH_LATENCY = registry.histogram(
+    "password_hash_duration_seconds", "Time taken to hash or verify a password, including queueing.",
+    ["operation"])
+RATE_LIMIT_REJECTIONS = registry.counter(
+    "rate_limit_rejections_total", "Requests answered with 429 by a rate limit.", ["rule", "scope"])
+
+
+class Instrumentation:
+    """Times every request and counts the SQL statements it runs.
+
+    Statement timings come from events on the app's engines, so statements run outside requests by
+    background workers are covered too, and another app in the same process is not counted twice.
+    Statements slower than SLOW_QUERY_MS are logged with their SQL.
+    """
+
+    def __init__(self, app=None, engines=()):
+        self.slow_query_seconds = None
+        self.logger = None
+        if app is not None:
+            self.init_app(app, engines)
+
+    def init_app(self, app, engines):
+        app.config.setdefault("SLOW_QUERY_MS", 200)
+        self.slow_query_seconds = app.config["SLOW_QUERY_MS"] / 1000
+        self.logger = app.logger
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        app.extensions["instrumentation"] = self
+
+    @staticmethod
+    def _start_request():
+        g.request_started = time.perf_counter()
+        g.query_count = 0
+        g.query_seconds = 0.0
+
+    @staticmethod
+    def _finish_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            endpoint = request.endpoint or "unmatched"
+            REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method,
+                                    status=response.status_code)
+            REQUEST_QUERIES.observe(g.get("query_count", 0), endpoint=endpoint)
+            REQUEST_QUERY_TIME.observe(g.get("query_seconds", 0.0), endpoint=endpoint)
+        return response
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        QUERY_LATENCY.observe(elapsed)
+        if has_request_context() and "query_count" in g:
+            g.query_count += 1
+            g.query_seconds += elapsed
+        if elapsed >= self.slow_query_seconds:
+            SLOW_QUERIES.inc()
+            self.logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split()))
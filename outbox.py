@@ -0,0 +1,257 @@
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, or_, update
+
+from metrics import SMTP_SEND_LATENCY
+
+
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP connections open so consecutive messages skip the connect/STARTTLS/login
+    round-trips."""
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True, timeout=30, max_size=2):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=max_size)
+
+    def _connect(self):
+        import smtplib  # Imported on first delivery; most worker processes never send mail
+        connection = smtplib.SMTP(host=self.host, port=self.port, timeout=self.timeout)
+        if self.use_tls:
+            connection.starttls()
+        if self.username and self.password:
+            connection.login(user=self.username, password=self.password)
+        return connection
+
+    def _checkout(self):
+        """Returns an idle connection that still answers NOOP, or a fresh one."""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            try:
+                if connection.noop()[0] == 250:
+                    return connection
+            except OSError:  # smtplib.SMTPException is an OSError too
+                pass
+            self._discard(connection)
+
+    @staticmethod
+    def _discard(connection):
+        try:
+            connection.quit()
+        except OSError:
+            connection.close()
+
+    @contextmanager
+    def connection(self):
+        """Lends out a connection; it goes back to the pool on success and is dropped if sending failed."""
+        connection = self._checkout()
+        try:
+            yield connection
+        except Exception:
+            self._discard(connection)
+            raise
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            self._discard(connection)
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class Outbox:
+    """Persists outgoing emails to a queue table and sends them from background worker threads.
+
+    Routes call enqueue() and return immediately; workers claim due messages, send them over pooled SMTP
+    connections and retry failures with exponential backoff. A message claimed by a worker that died is
+    picked up again once its lease runs out, so queued mail survives restarts and is shared safely
+    between processes; each claim counts as an attempt, so one that keeps killing its worker is given up
+    after MAIL_MAX_ATTEMPTS like any other failure. Once a message is sent or given up on its body is
+    emptied, as it may carry a password reset code; the rest of the row is kept for MAIL_RETENTION_DAYS
+    and then pruned.
+    """
+
+    def __init__(self, app=None, db=None, model=None):
+        self.app = None
+        self.db = None
+        self.model = None
+        self.pool = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._started_pid = None
+        if app is not None:
+            self.init_app(app, db, model)
+
+    def init_app(self, app, db, model):
+        app.config.setdefault("MAIL_SERVER", "smtp.office365.com")
+        app.config.setdefault("MAIL_PORT", 587)
+        app.config.setdefault("MAIL_USE_TLS", True)
+        app.config.setdefault("MAIL_USERNAME", None)
+        app.config.setdefault("MAIL_PASSWORD", None)
+        app.config.setdefault("MAIL_TIMEOUT", 30)
+        app.config.setdefault("MAIL_WORKERS", 2)
+        app.config.setdefault("MAIL_POOL_SIZE", 2)
+        app.config.setdefault("MAIL_MAX_ATTEMPTS", 5)
+        app.config.setdefault("MAIL_RETRY_BACKOFF", 30)  # Seconds before the first retry; doubles on each attempt
+        app.config.setdefault("MAIL_POLL_INTERVAL", 30)  # Seconds an idle worker waits before checking the table
+        app.config.setdefault("MAIL_LEASE", 300)  # Seconds a claimed message stays reserved for its worker
+        app.config.setdefault("MAIL_RETENTION_DAYS", 7)  # Days sent and failed messages are kept before pruning
+        self.app = app
+        self.db = db
+        self.model = model
+        self.pool = SMTPConnectionPool(
+            host=app.config["MAIL_SERVER"],
+            port=app.config["MAIL_PORT"],
+            username=app.config["MAIL_USERNAME"],
+            password=app.config["MAIL_PASSWORD"],
+            use_tls=app.config["MAIL_USE_TLS"],
+            timeout=app.config["MAIL_TIMEOUT"],
+            max_size=app.config["MAIL_POOL_SIZE"],
+        )
+        app.extensions["outbox"] = self
+        app.before_request(self.start)  # Messages queued before a restart are picked up on the first request
+
+    def enqueue(self, from_addr, to_addrs, msg):
+        """Stores a message for delivery and wakes a worker. Returns the queued row."""
+        message = self.model(
+            from_addr=from_addr,
+            to_addrs=json.dumps([address for address in to_addrs if address]),
+            message=msg,
+            status="pending",
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+            created_at=datetime.utcnow(),
+        )
+        self.db.session.add(message)
+        self.db.session.commit()
+        self.start()
+        self._wakeup.set()
+        return message
+
+    def start(self):
+        """Starts the worker threads once per process (a forked worker gets its own set)."""
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._workers = [
+                threading.Thread(target=self._run, name=f"outbox-worker-{number}", daemon=True)
+                for number in range(self.app.config["MAIL_WORKERS"])
+            ]
+            for worker in self._workers:
+                worker.start()
+            self._started_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()  # Cleared before draining so a message queued meanwhile is not missed
+            with self.app.app_context():
+                try:
+                    sent_any = self.drain()
+                    if not sent_any:
+                        self.prune()
+                except Exception:
+                    self.app.logger.exception("Outbox worker failed while draining the queue")
+                    sent_any = False
+            if not sent_any:
+                self._wakeup.wait(self.app.config["MAIL_POLL_INTERVAL"])
+
+    def drain(self, limit=None):
+        """Sends due messages until none are left (or `limit` were handled). Needs an app context."""
+        handled = 0
+        while limit is None or handled < limit:
+            message = self._claim()
+            if message is None:
+                break
+            self._deliver(message)
+            handled += 1
+        return handled
+
+    def prune(self):
+        """Deletes sent and failed messages older than MAIL_RETENTION_DAYS. Needs an app context."""
+        model, session = self.model, self.db.session
+        cutoff = datetime.utcnow() - timedelta(days=self.app.config["MAIL_RETENTION_DAYS"])
+        deleted = session.execute(delete(model).where(or_(
+            and_(model.status == "sent", model.sent_at < cutoff),
+            and_(model.status == "failed", model.created_at < cutoff)))).rowcount
+        session.commit()
+        return deleted
+
+    def _claim(self):
+        """Reserves the oldest due message for this worker, or returns None when nothing is due."""
+        model, session = self.model, self.db.session
+        now = datetime.utcnow()
+        due = and_(or_(model.status == "pending", model.status == "sending"), model.next_attempt_at <= now)
+        out_of_attempts = model.attempts >= self.app.config["MAIL_MAX_ATTEMPTS"]
+        # A lease that ran out on the last attempt means its worker died mid-send; the message is not retried
+        abandoned = session.execute(
+            update(model)
+            .where(due, out_of_attempts)
+            .values(status="failed", message="", last_error="The worker stopped during the last attempt")
+        ).rowcount
+        if abandoned:
+            self.app.logger.error("Gave up on %s outbox message(s) whose worker stopped while sending", abandoned)
+        while True:
+            candidate = (session.query(model.id)
+                         .filter(due, ~out_of_attempts)
+                         .order_by(model.id)
+                         .limit(1)
+                         .scalar())
+            if candidate is None:
+                session.commit()
+                return None
+            claimed = session.execute(
+                update(model)
+                .where(model.id == candidate, due, ~out_of_attempts)
+                .values(status="sending", attempts=model.attempts + 1,
+                        next_attempt_at=now + timedelta(seconds=self.app.config["MAIL_LEASE"]))
+            ).rowcount
+            session.commit()
+            if claimed:  # Another worker may have won the race for this row; if so, try the next one
+                return session.get(model, candidate)
+
+    def _deliver(self, message):
+        session = self.db.session
+        started = time.perf_counter()
+        try:
+            with self.pool.connection() as connection:
+                connection.sendmail(from_addr=message.from_addr, to_addrs=json.loads(message.to_addrs),
+                                    msg=message.message.encode("utf-8"))
+        except Exception as error:  # Besides SMTP errors, a malformed row must not keep its lease until it expires
+            SMTP_SEND_LATENCY.observe(time.perf_counter() - started, outcome="error")
+            message.last_error = repr(error)[:1000]
+            if message.attempts >= self.app.config["MAIL_MAX_ATTEMPTS"]:
+                message.status = "failed"
+                message.message = ""
+                self.app.logger.error("Giving up on outbox message %s: %r", message.id, error)
+            else:
+                message.status = "pending"
+                delay = self.app.config["MAIL_RETRY_BACKOFF"] * 2 ** (message.attempts - 1)
+                message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                self.app.logger.warning("Outbox message %s failed, retrying in %ss: %r", message.id, delay, error)
+        else:
+            SMTP_SEND_LATENCY.observe(time.perf_counter() - started, outcome="sent")
+            message.status = "sent"
+            message.sent_at = datetime.utcnow()
+            message.last_error = None
+            message.message = ""  # Only the recipient needs the text, which may hold a reset code
+        session.commit()
@@ -0,0 +1,100 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+class CachedPage:
+    """A rendered page together with the validators sent to browsers for conditional requests."""
+
+    __slots__ = ("body", "etag", "last_modified", "tags", "expires_at", "size")
+
+    def __init__(self, body, tags, ttl):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.tags = frozenset(tags)
+        self.expires_at = time.monotonic() + ttl
+        self.size = len(body) + len(self.etag) + 200  # Rough per-entry overhead on top of the body
+
+
+class PageCache:
+    """An in-process LRU cache of rendered pages bounded by total size.
+
+    Every entry carries tags naming the content it was rendered from (e.g. "feed" or "post:3"), and
+    invalidate() drops exactly the entries holding a tag. Entries also expire after `ttl` seconds, which
+    bounds how long another worker process can keep serving a page this process has invalidated.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_tag = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        app.config.setdefault("PAGE_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+        app.config.setdefault("PAGE_CACHE_TTL", 300)
+        self.max_bytes = app.config["PAGE_CACHE_MAX_BYTES"]
+        self.ttl = app.config["PAGE_CACHE_TTL"]
+        app.extensions["page_cache"] = self
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body, tags=()):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        entry = CachedPage(body, tags, self.ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if entry.size > self.max_bytes:
+                return entry
+            self._entries[key] = entry
+            self._size += entry.size
+            for tag in entry.tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while self._size > self.max_bytes:  # Evict least recently used pages until we fit again
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+        for tag in entry.tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,95 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from metrics import PASSWORD_HASH_LATENCY
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashing jobs are already waiting, so the request can be turned away early."""
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a small process pool instead of the request thread.
+
+    At most PASSWORD_HASH_QUEUE jobs may be in flight per process; beyond that PasswordHasherBusy is
+    raised rather than letting requests pile up behind the CPU-bound key derivation. With
+    PASSWORD_HASH_WORKERS set to 0 the work runs inline.
+    """
+
+    def __init__(self, app=None):
+        self.method = None
+        self.salt_length = None
+        self._method_prefix = None
+        self.workers = 0
+        self.timeout = None
+        self._slots = None
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+        app.config.setdefault("PASSWORD_SALT_LENGTH", 16)
+        app.config.setdefault("PASSWORD_HASH_WORKERS", 1)
+        app.config.setdefault("PASSWORD_HASH_QUEUE", 8)
+        app.config.setdefault("PASSWORD_HASH_TIMEOUT", 10)
+        self.method = app.config["PASSWORD_HASH_METHOD"]
+        self._method_prefix = None
+        self.salt_length = app.config["PASSWORD_SALT_LENGTH"]
+        self.workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.timeout = app.config["PASSWORD_HASH_TIMEOUT"]
+        self._slots = threading.BoundedSemaphore(app.config["PASSWORD_HASH_QUEUE"])
+        app.extensions["password_hasher"] = self
+
+    def hash(self, password):
+        """Returns a salted hash of `password` under the current policy."""
+        with PASSWORD_HASH_LATENCY.time(operation="hash"):
+            return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, stored_hash, password):
+        """Returns True if `password` matches `stored_hash`, whatever policy it was created under."""
+        with PASSWORD_HASH_LATENCY.time(operation="verify"):
+            return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        """Returns True if `stored_hash` was made with another method, cost or a shorter salt than the policy."""
+        method, _, rest = stored_hash.partition("$")
+        salt = rest.partition("$")[0]
+        return method != self.method_prefix() or len(salt) < self.salt_length
+
+    def method_prefix(self):
+        """The policy as werkzeug writes it at the start of a hash, e.g. "scrypt" becomes "scrypt:32768:8:1".
+
+        Werkzeug fills in its own defaults for the parts PASSWORD_HASH_METHOD leaves out, so the policy is
+        expanded by hashing a probe once per process rather than by repeating those defaults here. The probe
+        runs inline, not on the pool, so a full queue can never fail a login that has already been checked.
+        """
+        if self._method_prefix is None:
+            self._method_prefix = generate_password_hash("probe", self.method, 1).partition("$")[0]
+        return self._method_prefix
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy("Too many password checks are in progress, please try again shortly.")
+        try:
+            return self._pool().submit(func, *args).result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordHasherBusy("Password checks are taking too long, please try again shortly.")
+        finally:
+            self._slots.release()
+
+    def _pool(self):
+        """Creates the process pool lazily, once per process, so forked server workers never share one."""
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._executor_pid = os.getpid()
+        return self._executor
@@ -0,0 +1,177 @@
+import hashlib
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+from flask import request
+
+from metrics import RATE_LIMIT_REJECTIONS
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class RateLimited(Exception):
+    """Raised when a request is over a rate limit, before the view does any of its expensive work."""
+
+    def __init__(self, rule, retry_after):
+        super().__init__(f"Too many requests to {rule}")
+        self.rule = rule
+        self.retry_after = retry_after
+
+
+@lru_cache(maxsize=64)
+def parse_limit(text):
+    """Parses "10/minute" into (tokens refilled per second, bucket size); empty or "0" means no limit.
+
+    Raises ValueError for anything else, so a mistyped limit is caught when the app starts."""
+    if not text or text.strip() == "0":
+        return None
+    count, _, period = text.partition("/")
+    period = period.strip().rstrip("s") or "second"
+    if not count.strip().isdigit() or int(count) < 1 or period not in PERIODS:
+        raise ValueError(f"{text!r} is not a rate limit; use a count per {', '.join(PERIODS)}, e.g. \"10/minute\".")
+    count = int(count)
+    return count / PERIODS[period], count
+
+
+def _take(state, rate, burst, now):
+    """Refills a bucket for the time elapsed since `state` and takes one token from it.
+
+    Returns the new (tokens, updated) state and how many seconds to wait before a token is available
+    (0 if one was taken)."""
+    tokens, updated = state if state is not None else (burst, now)
+    tokens = min(burst, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryBuckets:
+    """Token buckets held in this process; each worker process enforces the limits on its own."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        with self._lock:
+            self._buckets[key], wait = _take(self._buckets.get(key), rate, burst, time.monotonic())
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:  # Forgets the clients seen least recently
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class SQLiteBuckets:
+    """Token buckets kept in a local SQLite file, so every worker process on the machine shares them."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        if getattr(self._local, "pid", None) != os.getpid():  # Connections are never shared with forked workers
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")   # Losing the last few takes in a crash is harmless
+            connection.execute("CREATE TABLE IF NOT EXISTS buckets "
+                               "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def take(self, key, rate, burst):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            state, wait = _take(connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?",
+                                                   (key,)).fetchone(), rate, burst, now)
+            connection.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                               (key, *state))
+            if random.random() < 0.001:  # Now and then drops buckets idle long enough to have refilled
+                connection.execute("DELETE FROM buckets WHERE updated < ?", (now - PERIODS["day"],))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class RateLimiter:
+    """Token bucket rate limits for the routes that hash passwords or send email.
+
+    Each limited POST takes a token from a bucket for the client IP and one for the submitted account
+    (email), so neither a single client nor a spread-out attack on one account can keep the expensive work
+    running. The limit for a rule is read from RATE_LIMIT_<RULE>, e.g. "10/minute". Buckets live in
+    memory per process unless RATE_LIMIT_STORAGE names a SQLite file shared by all workers; if that file
+    cannot be used the request is let through rather than failing.
+    """
+
+    def __init__(self, app=None):
+        self.config = None
+        self.proxies = 0
+        self.storage = None
+        self.logger = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RATE_LIMIT_STORAGE", "")
+        app.config.setdefault("RATE_LIMIT_PROXIES", 0)
+        self.config = app.config
+        self.proxies = app.config["RATE_LIMIT_PROXIES"]
+        if app.config["RATE_LIMIT_STORAGE"]:
+            self.storage = SQLiteBuckets(app.config["RATE_LIMIT_STORAGE"])
+        else:
+            self.storage = MemoryBuckets()
+        self.logger = app.logger
+        for name, value in app.config.items():  # A bad limit fails here instead of on every limited request
+            if name.startswith("RATE_LIMIT_") and name not in ("RATE_LIMIT_STORAGE", "RATE_LIMIT_PROXIES"):
+                try:
+                    parse_limit(value)
+                except ValueError as error:
+                    raise ValueError(f"{name}: {error}") from None
+        app.extensions["rate_limiter"] = self
+
+    def client_ip(self):
+        """The client address, taken from X-Forwarded-For only as far as RATE_LIMIT_PROXIES proxies are trusted."""
+        route = request.access_route
+        if self.proxies and len(route) >= self.proxies:
+            return route[-self.proxies]
+        return request.remote_addr or ""
+
+    def check(self, rule, account=None):
+        """Takes a token for the client IP and the account, raising RateLimited if either bucket is empty."""
+        limit = parse_limit(self.config.get(f"RATE_LIMIT_{rule.upper()}"))
+        if limit is None:
+            return
+        scopes = [("ip", self.client_ip())]
+        if account:
+            scopes.append(("account", account.strip().lower()))
+        for scope, value in scopes:
+            key = f"{rule}:{scope}:" + hashlib.sha1(value.encode("utf-8")).hexdigest()
+            try:
+                wait = self.storage.take(key, *limit)
+            except sqlite3.Error as error:
+                self.logger.warning("Rate limit storage unavailable, letting the request through: %s", error)
+                return
+            if wait:
+                RATE_LIMIT_REJECTIONS.inc(rule=rule, scope=scope)
+                raise RateLimited(rule, math.ceil(wait))
+
+    def limit(self, rule, account_field="email"):
+        """Decorator limiting the POSTs of a view under `rule`; GETs only render the form and pass freely."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method == "POST":
+                    self.check(rule, account=request.form.get(account_field))
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
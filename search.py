@@ -0,0 +1,151 @@
+import re
+from html import escape, unescape
+from html.parser import HTMLParser
+
+from markupsafe import Markup
+from sqlalchemy import text
+
+# Snippets come back from the database with matches wrapped in these control characters; they are turned
+# into <mark> tags only after the rest of the snippet has been escaped.
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def html_to_text(markup):
+    """Returns the readable text of an HTML fragment with whitespace collapsed."""
+    extractor = _TextExtractor()
+    extractor.feed(markup or "")
+    extractor.close()
+    return " ".join(unescape(" ".join(extractor.parts)).split())
+
+
+def highlight(snippet):
+    """Escapes a search snippet and marks up the matched words."""
+    return Markup(escape(snippet or "")
+                  .replace(HIGHLIGHT_START, "<mark>")
+                  .replace(HIGHLIGHT_END, "</mark>"))
+
+
+class SearchIndex:
+    """Full-text index over each blog post's title, subtitle and body text.
+
+    SQLite databases get an FTS5 virtual table ranked with bm25(); PostgreSQL gets a side table holding a
+    weighted tsvector behind a GIN index, ranked with ts_rank(). Callers keep it in sync by calling
+    index_post()/remove_post() inside the same transaction as the post change.
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+
+    def init_app(self, app, db):
+        self.db = db
+        app.extensions["search_index"] = self
+
+    @property
+    def _postgres(self):
+        return self.db.engine.dialect.name == "postgresql"
+
+    def create(self):
+        """Creates the index structures if they do not exist yet."""
+        with self.db.engine.begin() as connection:
+            if self._postgres:
+                connection.execute(text(
+                    "CREATE TABLE IF NOT EXISTS blog_posts_search ("
+                    " post_id INTEGER PRIMARY KEY REFERENCES blog_posts (id) ON DELETE CASCADE,"
+                    " body TEXT NOT NULL,"
+                    " document TSVECTOR NOT NULL)"))
+                connection.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_blog_posts_search_document"
+                    " ON blog_posts_search USING GIN (document)"))
+            else:
+                connection.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS blog_posts_fts"
+                    " USING fts5(title, subtitle, body, tokenize='porter unicode61')"))
+
+    def index_post(self, post):
+        """Adds or refreshes one post in the index. The post must already have an id (flush first)."""
+        values = {"id": post.id, "title": post.title, "subtitle": post.subtitle, "body": html_to_text(post.body)}
+        if self._postgres:
+            self.db.session.execute(text(
+                "INSERT INTO blog_posts_search (post_id, body, document) VALUES (:id, :body,"
+                " setweight(to_tsvector('english', :title), 'A') ||"
+                " setweight(to_tsvector('english', :subtitle), 'B') ||"
+                " setweight(to_tsvector('english', :body), 'C'))"
+                " ON CONFLICT (post_id) DO UPDATE SET body = EXCLUDED.body, document = EXCLUDED.document"),
+                values)
+        else:
+            self.db.session.execute(text("DELETE FROM blog_posts_fts WHERE rowid = :id"), values)
+            self.db.session.execute(text(
+                "INSERT INTO blog_posts_fts (rowid, title, subtitle, body) VALUES (:id, :title, :subtitle, :body)"),
+                values)
+
+    def remove_post(self, post_id):
+        table, key = ("blog_posts_search", "post_id") if self._postgres else ("blog_posts_fts", "rowid")
+        self.db.session.execute(text(f"DELETE FROM {table} WHERE {key} = :id"), {"id": post_id})
+
+    def search(self, query, page=1, per_page=10):
+        """Returns one page of ranked matches as dicts (id, title, subtitle, date, snippet) and whether
+        another page follows."""
+        terms = re.findall(r"\w+", query or "")
+        if not terms:
+            return [], False
+        params = {"limit": per_page + 1, "offset": (page - 1) * per_page}
+        if self._postgres:
+            params["query"] = " ".join(terms)
+            sql = ("SELECT p.id, p.title, p.subtitle, p.date,"
+                   " ts_headline('english', s.body, q, 'MaxFragments=2, MaxWords=30, MinWords=10, StartSel='"
+                   " || chr(2) || ', StopSel=' || chr(3)) AS snippet"
+                   " FROM blog_posts_search s JOIN blog_posts p ON p.id = s.post_id,"
+                   " plainto_tsquery('english', :query) q"
+                   " WHERE s.document @@ q"
+                   " ORDER BY ts_rank(s.document, q) DESC, p.id DESC"
+                   " LIMIT :limit OFFSET :offset")
+        else:
+            # Every term is quoted so FTS5 query syntax typed by readers is matched literally
+            params["query"] = " ".join('"%s"' % term for term in terms)
+            sql = ("SELECT p.id, p.title, p.subtitle, p.date,"
+                   " snippet(blog_posts_fts, 2, char(2), char(3), '…', 24) AS snippet"
+                   " FROM blog_posts_fts JOIN blog_posts p ON p.id = blog_posts_fts.rowid"
+                   " WHERE blog_posts_fts MATCH :query"
+                   " ORDER BY bm25(blog_posts_fts, 10.0, 5.0, 1.0), p.id DESC"
+                   " LIMIT :limit OFFSET :offset")
+        rows = [dict(row._mapping) for row in self.db.session.execute(text(sql), params)]
+        return rows[:per_page], len(rows) > per_page
+
+    def rebuild(self, model, batch_size=500, progress=None):
+        """Re-indexes every post in id order, committing one batch at a time. Returns the number indexed."""
+        session = self.db.session
+        session.execute(text("DELETE FROM blog_posts_search" if self._postgres else "DELETE FROM blog_posts_fts"))
+        session.commit()
+        last_id, indexed = 0, 0
+        while True:
+            posts = model.query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+            if not posts:
+                return indexed
+            for post in posts:
+                self.index_post(post)
+            session.commit()
+            last_id = posts[-1].id
+            indexed += len(posts)
+            session.expunge_all()  # Keeps memory flat however many posts there are
+            if progress is not None:
+                progress(indexed)
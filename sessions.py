@@ -0,0 +1,80 @@
+import hashlib
+import secrets
+from datetime import datetime
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class StoredSession(CallbackDict, SessionMixin):
+    """A session whose data lives in the database; the cookie only carries its random id."""
+
+    def __init__(self, initial=None, sid=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.modified = False
+        self.opened_as = self.get("_user_id")  # Who the session belonged to when the request started
+
+
+class DatabaseSessionInterface(SessionInterface):
+    """Keeps session data in a database table instead of a signed cookie.
+
+    The cookie holds a random id and the table stores only its SHA-256, so a leaked table cannot be turned
+    into working cookies. Whenever the logged-in user changes (login, logout) the session moves to a new id
+    and the old row is deleted, so an id planted in a browser before login is worthless afterwards. A row is
+    written only when the session changes, which together with the sliding expiry in main.py means most
+    requests read their session without writing it back.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+
+    @staticmethod
+    def _key(sid):
+        return hashlib.sha256(sid.encode("utf-8")).hexdigest()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            table = self.model.__table__
+            with self.db.engine.connect() as connection:
+                data = connection.execute(
+                    table.select().with_only_columns(table.c.data)
+                    .where(table.c.id == self._key(sid), table.c.expires_at > datetime.utcnow())).scalar()
+            if data is not None:
+                return StoredSession(self.serializer.loads(data), sid)
+        return StoredSession(sid=secrets.token_urlsafe(32))
+
+    def save_session(self, app, session, response):
+        name, domain, path = self.get_cookie_name(app), self.get_cookie_domain(app), self.get_cookie_path(app)
+        table = self.model.__table__
+        if not session:
+            if session.modified:  # The session was emptied (e.g. logout), so forget it on both ends
+                with self.db.engine.begin() as connection:
+                    connection.execute(table.delete().where(table.c.id == self._key(session.sid)))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        response.vary.add("Cookie")
+        rotate = session.get("_user_id") != session.opened_as
+        if not rotate and not self.should_set_cookie(app, session):
+            return
+        expires = self.get_expiration_time(app, session)
+        values = dict(data=self.serializer.dumps(dict(session)),
+                      expires_at=(expires.replace(tzinfo=None) if expires else
+                                  datetime.utcnow() + app.permanent_session_lifetime))
+        with self.db.engine.begin() as connection:
+            if rotate:  # The session changed hands, so the id it had before stops working
+                connection.execute(table.delete().where(table.c.id == self._key(session.sid)))
+                session.sid = secrets.token_urlsafe(32)
+            updated = connection.execute(table.update().where(table.c.id == self._key(session.sid)).values(values))
+            if updated.rowcount == 0:
+                connection.execute(table.insert().values(id=self._key(session.sid), **values))
+        response.set_cookie(name, session.sid, expires=expires, httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path, secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+from flask import make_response, request, url_for
+from sqlalchemy.orm import load_only
+
+from timestamps import POST_DATE_FORMAT, parse_legacy
+
+
+class SyndicationDocument:
+    """One generated XML document, kept both plain and gzip-compressed, with its validators."""
+
+    __slots__ = ("body", "gzipped", "etag", "last_modified")
+
+    def __init__(self, body, last_modified):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = last_modified
+
+
+class Syndication:
+    """Builds /feed.xml (Atom) and /sitemap.xml from the blog posts and serves them from memory.
+
+    Every post is rendered once into a sitemap fragment, and the newest SYNDICATION_FEED_SIZE posts into
+    Atom entries. post_saved()/post_deleted() re-render only the fragment of the post that changed, and the
+    documents are then re-joined and compressed once, not per request. A full rebuild happens on the first
+    request and after SYNDICATION_TTL seconds, which also picks up changes made by other worker processes.
+    """
+
+    def __init__(self, app=None, db=None, model=None):
+        self.db = db
+        self.model = model
+        self.feed_size = 20
+        self.ttl = 300
+        self.title = ""
+        self._lock = threading.Lock()
+        self._entries = []          # (post id, Atom <updated> time, Atom entry), newest first
+        self._urls = {}             # post id -> sitemap <url> fragment
+        self._documents = {}
+        self._expires_at = 0
+        if app is not None:
+            self.init_app(app, db, model)
+
+    def init_app(self, app, db, model):
+        app.config.setdefault("SYNDICATION_FEED_SIZE", 20)
+        app.config.setdefault("SYNDICATION_TTL", 300)
+        app.config.setdefault("SYNDICATION_TITLE", "Blog")
+        self.db = db
+        self.model = model
+        self.feed_size = app.config["SYNDICATION_FEED_SIZE"]
+        self.ttl = app.config["SYNDICATION_TTL"]
+        self.title = app.config["SYNDICATION_TITLE"]
+        app.extensions["syndication"] = self
+
+    def serve(self, name):
+        """Returns the named document ("feed" or "sitemap") as a conditional response, gzipped if accepted."""
+        with self._lock:
+            if self._expires_at <= time.monotonic():
+                self._rebuild()
+            document = self._documents[name]
+        gzipped = "gzip" in request.accept_encodings
+        response = make_response(document.gzipped if gzipped else document.body)
+        response.mimetype = "application/atom+xml" if name == "feed" else "application/xml"
+        if gzipped:
+            response.content_encoding = "gzip"
+        response.vary.add("Accept-Encoding")
+        response.set_etag(document.etag + ("-gzip" if gzipped else ""))
+        response.last_modified = document.last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = self.ttl
+        return response.make_conditional(request)
+
+    def post_saved(self, post):
+        """Re-renders the fragments of a new or edited post. Call after the change has been committed."""
+        with self._lock:
+            if not self._documents:
+                return  # Nothing built yet; the first request builds everything
+            self._urls[post.id] = self._render_url(post)
+            ids = [entry[0] for entry in self._entries]
+            if post.id in ids:
+                self._entries[ids.index(post.id)] = self._render_entry(post)
+            elif not ids or post.id > ids[-1] or len(ids) < self.feed_size:
+                self._entries.append(self._render_entry(post))
+                self._entries.sort(key=lambda entry: entry[0], reverse=True)
+                del self._entries[self.feed_size:]
+            self._assemble()
+
+    def post_deleted(self, post_id):
+        """Drops a deleted post. Call after the deletion has been committed."""
+        with self._lock:
+            if not self._documents:
+                return
+            self._urls.pop(post_id, None)
+            if any(entry[0] == post_id for entry in self._entries):
+                self._expires_at = 0  # An older post moves into the feed; rebuild on the next request
+            else:
+                self._assemble()
+
+    def _rebuild(self):
+        model = self.model
+        columns = load_only(model.id, model.title, model.subtitle, model.excerpt, model.author_name, model.date,
+                            model.last_edit, model.published_at, model.edited_at)
+        self._urls, self._entries = {}, []
+        last_id = None
+        while True:  # Walks the posts in batches so a large blog never sits in the session at once
+            query = model.query.options(columns).order_by(model.id.desc())
+            if last_id is not None:
+                query = query.filter(model.id < last_id)
+            posts = query.limit(1000).all()
+            if not posts:
+                break
+            for post in posts:
+                self._urls[post.id] = self._render_url(post)
+                if len(self._entries) < self.feed_size:
+                    self._entries.append(self._render_entry(post))
+            last_id = posts[-1].id
+            self.db.session.expunge_all()
+        self._assemble()
+        self._expires_at = time.monotonic() + self.ttl
+
+    def _assemble(self):
+        updated = max((updated for _, updated, _ in self._entries), default=_atom_time(None))
+        feed = ('<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">'
+                f"<title>{escape(self.title)}</title>"
+                f'<link href={quoteattr(url_for("get_all_posts", _external=True))}/>'
+                f'<link rel="self" href={quoteattr(url_for("feed", _external=True))}/>'
+                f'<id>{escape(url_for("get_all_posts", _external=True))}</id>'
+                f"<updated>{updated}</updated>"
+                + "".join(entry for _, _, entry in self._entries) + "</feed>")
+        pages = [url_for(endpoint, _external=True) for endpoint in ("get_all_posts", "about", "contact")]
+        sitemap = ('<?xml version="1.0" encoding="utf-8"?>\n'
+                   '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                   + "".join(f"<url><loc>{escape(page)}</loc></url>" for page in pages)
+                   + "".join(self._urls[post_id] for post_id in sorted(self._urls, reverse=True)) + "</urlset>")
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        for name, body in (("feed", feed), ("sitemap", sitemap)):
+            body = body.encode("utf-8")
+            previous = self._documents.get(name)
+            # A rebuild that changes nothing keeps the old Last-Modified, so crawlers keep getting 304s
+            if previous is not None and previous.body == body:
+                continue
+            self._documents[name] = SyndicationDocument(body, now)
+
+    @staticmethod
+    def _timestamps(post):
+        published = post.published_at or parse_legacy(post.date, POST_DATE_FORMAT)
+        updated = post.edited_at or parse_legacy(post.last_edit, POST_DATE_FORMAT) or published
+        return published, updated
+
+    def _render_entry(self, post):
+        published, updated = self._timestamps(post)
+        link = url_for("show_post", post_id=post.id, _external=True)
+        entry = (f"<entry><title>{escape(post.title)}</title>"
+                 f"<link href={quoteattr(link)}/><id>{escape(link)}</id>"
+                 f"<published>{_atom_time(published)}</published><updated>{_atom_time(updated)}</updated>"
+                 f"<author><name>{escape(post.author_name or self.title)}</name></author>"
+                 f"<summary>{escape(post.excerpt or post.subtitle)}</summary></entry>")
+        return post.id, _atom_time(updated), entry
+
+    def _render_url(self, post):
+        _, updated = self._timestamps(post)
+        lastmod = f"<lastmod>{updated:%Y-%m-%d}</lastmod>" if updated else ""
+        return f"<url><loc>{escape(url_for('show_post', post_id=post.id, _external=True))}</loc>{lastmod}</url>"
+
+
+def _atom_time(value):
+    """Formats a timestamp as RFC 3339 UTC; the stored naive timestamps are server local time."""
+    if not value:
+        return "1970-01-01T00:00:00Z"
+    return f"{value.astimezone(timezone.utc):%Y-%m-%dT%H:%M:%S}Z"
@@ -0,0 +1,107 @@
+import smtplib
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import main
+from outbox import SMTPConnectionPool
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """Returns a function building blog apps, each on its own throwaway SQLite database.
+
+    Settings are passed the way production passes them, as environment variables read by create_app().
+    Mail and password hashing run on the calling thread so tests can see their effects straight away.
+    """
+    monkeypatch.setenv("APP_SECRET", "test-secret")
+    monkeypatch.setenv("NAME", "Tester")
+    monkeypatch.setenv("MY_EMAIL", "blog@example.com")
+    monkeypatch.setenv("MAIL_WORKERS", "0")
+    monkeypatch.setenv("PASSWORD_HASH_WORKERS", "0")
+    monkeypatch.setenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+
+    def make(name="blog", **environ):
+        monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / name}.db")
+        for key, value in environ.items():
+            monkeypatch.setenv(key, str(value))
+        app = main.create_app()
+        app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+        with app.app_context():
+            main.init_db()
+        return app
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_user(app, email="admin@example.com", password="secret", name="Admin"):
+    """Adds a user straight to the database and returns its id; the first user added is the admin."""
+    with app.app_context():
+        user = main.User(email=email, password=generate_password_hash(password, "pbkdf2:sha256:1000"), name=name)
+        main.db.session.add(user)
+        main.db.session.commit()
+        return user.id
+
+
+def log_in(client, user_id):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+
+
+def add_post(client, title, body="<p>Some words.</p>"):
+    """Publishes a post through the new-post form; the client must be logged in as the admin."""
+    response = client.post("/new-post", data=dict(title=title, subtitle=f"About {title}", author="Admin",
+                                                  img_url="https://example.com/cover.png", body=body))
+    assert response.status_code == 302, response.get_data(as_text=True)
+
+
+@pytest.fixture
+def admin(app, client):
+    """Logs the test client in as the admin (user 1) and returns a function publishing posts as them."""
+    log_in(client, add_user(app))
+    return lambda title, **kwargs: add_post(client, title, **kwargs)
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP, recording what is sent through it."""
+
+    def __init__(self, server):
+        self.server = server
+        self.open = True
+
+    def noop(self):
+        return (250, b"OK") if self.open else (421, b"Closed")
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.server.refuse:
+            raise smtplib.SMTPRecipientsRefused({address: (550, b"No such user") for address in to_addrs})
+        self.server.sent.append((from_addr, to_addrs, msg.decode("utf-8")))
+
+    def quit(self):
+        self.open = False
+
+    close = quit
+
+
+class FakePool(SMTPConnectionPool):
+    """A connection pool whose connections go to an in-memory fake server instead of the network."""
+
+    def __init__(self):
+        super().__init__("localhost", 25, max_size=2)
+        self.sent = []
+        self.connects = 0
+        self.refuse = False
+
+    def _connect(self):
+        self.connects += 1
+        return FakeSMTP(self)
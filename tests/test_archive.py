@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import main
+
+
+def month_counts(app):
+    with app.app_context():
+        return [(month.year, month.month, month.post_count)
+                for month in main.ArchiveMonth.query.order_by(main.ArchiveMonth.year, main.ArchiveMonth.month)]
+
+
+def test_publishing_and_deleting_keep_the_month_counts(app, client, admin):
+    now = datetime.now()
+    admin("First")
+    assert month_counts(app) == [(now.year, now.month, 1)]
+    admin("Second")
+    admin("Third")
+    assert month_counts(app) == [(now.year, now.month, 3)]
+    client.get("/delete/2")
+    assert month_counts(app) == [(now.year, now.month, 2)]
+    page = client.get(f"/archive/{now.year}/{now.month}").get_data(as_text=True)
+    assert "First" in page and "Third" in page and "Second" not in page
+    assert f"{now:%B %Y}" in client.get("/").get_data(as_text=True)
+
+
+def test_rebuild_matches_the_maintained_counts(app, admin):
+    admin("First")
+    admin("Second")
+    maintained = month_counts(app)
+    with app.app_context():
+        main.rebuild_archive_months()
+    assert month_counts(app) == maintained
+
+
+def test_author_page_lists_their_posts(client, admin):
+    admin("Mine")
+    page = client.get("/author/1").get_data(as_text=True)
+    assert "Mine" in page
+    assert client.get("/author/99").status_code == 404
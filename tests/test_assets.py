@@ -0,0 +1,37 @@
+import re
+
+from flask import render_template_string
+
+import assets
+from assets import Assets
+
+
+def static_url(app, filename):
+    with app.test_request_context():
+        return render_template_string("{{ url_for('static', filename=filename) }}", filename=filename)
+
+
+def test_built_assets_are_loaded_and_served_as_immutable(make_app, monkeypatch):
+    result = make_app("builder").test_cli_runner().invoke(args=["build-assets"])
+    assert result.exit_code == 0, result.output
+
+    def build_at_startup(*args):
+        raise AssertionError("create_app() must only load the manifest")
+    monkeypatch.setattr(Assets, "build", build_at_startup)
+    monkeypatch.setattr(assets.os, "walk", build_at_startup)
+    app = make_app("web")
+    url = static_url(app, "css/clean-blog.min.css")
+    assert re.fullmatch(r"/assets/css/clean-blog\.min\.[0-9a-f]{12}\.css", url)
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+
+    response = app.test_client().get(static_url(app, "bundle.css"), headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200 and response.content_encoding == "gzip"
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+
+
+def test_pages_link_plain_static_files_until_assets_are_built(make_app, monkeypatch):
+    monkeypatch.setattr(Assets, "_load", lambda self: False)
+    app = make_app()
+    assert static_url(app, "css/clean-blog.min.css") == "/static/css/clean-blog.min.css"
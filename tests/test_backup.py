@@ -0,0 +1,106 @@
+import gzip
+
+import pytest
+from sqlalchemy import select
+
+import main
+from backup import BackupError, export_tables, import_tables
+from conftest import add_post, add_user, log_in
+
+TABLES = [main.User.__table__, main.BlogPost.__table__, main.Comment.__table__]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(batches):
+    calls = []
+
+    def progress(table, count):
+        calls.append(table)
+        if len(calls) == batches:
+            raise Interrupted
+    return progress
+
+
+def dump(app):
+    with app.app_context():
+        return {table.name: [dict(row) for row in main.db.session.execute(select(table).order_by(table.c.id)).mappings()]
+                for table in TABLES}
+
+
+@pytest.fixture
+def source(make_app):
+    app = make_app("source")
+    client = app.test_client()
+    log_in(client, add_user(app))
+    add_user(app, email="reader@example.com", name="Reader")
+    for number in range(1, 4):
+        add_post(client, f"Post {number}", body=f"<p>Body of post number {number} about gardening</p>")
+        for reply in range(2):
+            client.post(f"/post/{number}/comments", data=dict(comment=f"<p>Reply {reply} to {number}</p>"))
+    return app
+
+
+@pytest.fixture
+def target(make_app):
+    return make_app("target")
+
+
+def test_export_then_import_copies_every_row(source, target, tmp_path):
+    path = str(tmp_path / "blog.jsonl.gz")
+    result = source.test_cli_runner().invoke(args=["blog", "export", path, "--batch-size", "2"])
+    assert result.exit_code == 0, result.output
+    assert "Exported 2 user, 3 blog_posts, 6 comments" in result.output
+    result = target.test_cli_runner().invoke(args=["blog", "import", path, "--batch-size", "2"])
+    assert result.exit_code == 0, result.output
+    assert dump(target) == dump(source)
+    assert "Post 2" in target.test_client().get("/search?q=gardening").get_data(as_text=True)
+    with target.app_context():
+        assert main.ArchiveMonth.query.one().post_count == 3
+
+
+def test_an_interrupted_export_resumes_where_it_stopped(source, target, tmp_path):
+    path = str(tmp_path / "blog.jsonl.gz")
+    with source.app_context():
+        with pytest.raises(Interrupted):
+            export_tables(main.db.session, TABLES, path, main.ModelEncoder, batch_size=2,
+                          progress=interrupt_after(3))
+        with gzip.open(path, "rt") as partial:
+            assert len(partial.readlines()) == 1 + 2 + 3   # The header, then users and posts; no comments yet
+        counts = export_tables(main.db.session, TABLES, path, main.ModelEncoder, batch_size=2, resume=True)
+    assert counts == {"user": 2, "blog_posts": 3, "comments": 6}
+    with target.app_context():
+        import_tables(main.db.session, TABLES, path)
+    assert dump(target) == dump(source)
+
+
+def test_an_interrupted_import_needs_resume_and_skips_committed_rows(source, target, tmp_path):
+    path = str(tmp_path / "blog.jsonl.gz")
+    with source.app_context():
+        export_tables(main.db.session, TABLES, path, main.ModelEncoder)
+    with target.app_context():
+        with pytest.raises(Interrupted):
+            import_tables(main.db.session, TABLES, path, batch_size=2, progress=interrupt_after(3))
+        main.db.session.rollback()
+        with pytest.raises(BackupError, match="--resume"):
+            import_tables(main.db.session, TABLES, path, batch_size=2)
+        counts = import_tables(main.db.session, TABLES, path, batch_size=2, resume=True)
+    assert counts == {"user": 2, "blog_posts": 3, "comments": 6}
+    assert dump(target) == dump(source)
+
+
+def test_import_refuses_a_database_with_rows(source, tmp_path):
+    path = str(tmp_path / "blog.jsonl.gz")
+    runner = source.test_cli_runner()
+    runner.invoke(args=["blog", "export", path])
+    result = runner.invoke(args=["blog", "import", path])
+    assert result.exit_code != 0 and "is not empty" in result.output
+
+
+def test_import_rejects_other_files(target, tmp_path):
+    path = tmp_path / "other.gz"
+    path.write_bytes(gzip.compress(b'{"format": "something-else"}\n'))
+    result = target.test_cli_runner().invoke(args=["blog", "import", str(path)])
+    assert result.exit_code != 0 and "is not a blog-export file" in result.output
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import select
+
+import main
+from conftest import add_post, add_user, log_in
+
+
+@pytest.fixture
+def post(admin):
+    admin("Talk to me")
+    return 1
+
+
+def test_posting_a_comment_returns_it_as_json(client, post):
+    response = client.post("/post/1/comments", data=dict(comment="<p>Nice <script>x</script>post</p>"))
+    assert response.status_code == 201
+    assert response.get_json()["html"] == "<p>Nice post</p>"
+    listing = client.get("/post/1/comments").get_json()
+    assert [comment["html"] for comment in listing["comments"]] == ["<p>Nice post</p>"]
+    assert listing["cursor"] == response.get_json()["id"] and listing["more"] is False
+
+
+def test_anonymous_visitors_cannot_comment(app, post):
+    response = app.test_client().post("/post/1/comments", data=dict(comment="<p>Hi</p>"))
+    assert response.status_code == 401
+
+
+def test_long_polling_is_off_by_default(app, client, post):
+    started = time.monotonic()
+    assert client.get("/post/1/comments?after=0&wait=8").get_json()["comments"] == []
+    assert time.monotonic() - started < 1
+
+
+def test_long_polling_returns_when_a_comment_arrives(make_app):
+    app = make_app(COMMENTS_LONG_POLL_MAX=5)
+    writer = app.test_client()
+    log_in(writer, add_user(app))
+    add_post(writer, "Talk to me")
+    threading.Timer(0.3, lambda: writer.post("/post/1/comments", data=dict(comment="<p>Hello</p>"))).start()
+    started = time.monotonic()
+    listing = app.test_client().get("/post/1/comments?after=0&wait=5").get_json()
+    assert [comment["html"] for comment in listing["comments"]] == ["<p>Hello</p>"]
+    assert time.monotonic() - started < 3
+
+
+def test_collapse_avatars_empties_the_copies_and_keeps_rendering_them(app, client, post):
+    reader = app.test_client()
+    log_in(reader, add_user(app, email="reader@example.com", name="Reader"))
+    for commenter in (client, reader, reader):
+        assert commenter.post("/post/1/comments", data=dict(comment="<p>Hi</p>")).status_code == 201
+    users, comments = main.User.__table__, main.Comment.__table__
+    with app.app_context():   # As left by older versions: no stored avatar, a copy in every comment
+        emails = dict(main.db.session.execute(select(users.c.id, users.c.email)).all())
+        main.db.session.execute(users.update().values(avatar_url=None))
+        for user_id, email in emails.items():
+            main.db.session.execute(comments.update().where(comments.c.commenter_id == user_id)
+                                    .values(image_url=main.gravatar_url(email)))
+        main.db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["collapse-avatars", "--batch-size", "1"])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert main.db.session.scalars(select(comments.c.image_url)).all() == [""] * 3
+        assert dict(main.db.session.execute(select(users.c.id, users.c.avatar_url)).all()) == {
+            user_id: main.gravatar_url(email) for user_id, email in emails.items()}
+    page = app.test_client().get("/post/1").get_data(as_text=True)
+    assert all(f'src="{main.gravatar_url(email)}"' in page for email in emails.values())
+    listing = app.test_client().get("/post/1/comments").get_json()["comments"]
+    assert [comment["author"]["avatar"] for comment in listing] == [
+        main.gravatar_url(emails[user_id]) for user_id in (1, 2, 2)]
@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, Text, create_engine, select
+from sqlalchemy.orm import Session
+
+from content import PIPELINE_VERSION, excerpt, process_post, reading_time, reprocess, sanitize
+
+
+@pytest.mark.parametrize("markup, expected", [
+    ("<p>Hello <b>world</b></p>", "<p>Hello <b>world</b></p>"),
+    ("<p>Hi<script>alert(1)</script></p>", "<p>Hi</p>"),
+    ("<style>p {}</style><p>Kept</p>", "<p>Kept</p>"),
+    ("<svg><circle/><p>inside</p></svg>after", "after"),
+    ('<p onclick="steal()" class="lead">x</p>', '<p class="lead">x</p>'),
+    ('<a href="javascript:alert(1)">x</a>', "<a>x</a>"),
+    ('<a href=" JavaScript:alert(1)">x</a>', "<a>x</a>"),
+    ('<a href="https://example.com/?a=1&b=2">x</a>', '<a href="https://example.com/?a=1&amp;b=2">x</a>'),
+    ('<a href="/post/1" target="_blank">x</a>', '<a href="/post/1" target="_blank" rel="noopener noreferrer">x</a>'),
+    ('<img src="data:image/png;base64,AAAA" alt="x">', '<img alt="x" loading="lazy" decoding="async">'),
+    ('<img src="/cover.png">', '<img src="/cover.png" loading="lazy" decoding="async">'),
+    ("<blink>text</blink>", "text"),
+    ("<p><em>open", "<p><em>open</em></p>"),
+    ("text</p></div>", "text"),
+    ("1 < 2 &amp; 3 > 2", "1 &lt; 2 &amp; 3 &gt; 2"),
+    ('<p title="&quot;><script>">x</p>', '<p title="&quot;&gt;&lt;script&gt;">x</p>'),
+    (None, ""),
+])
+def test_sanitize(markup, expected):
+    assert sanitize(markup) == expected
+
+
+def test_excerpt_cuts_at_a_word_boundary():
+    assert excerpt("short") == "short"
+    assert excerpt("one two three, four", length=15) == "one two three…"
+
+
+def test_reading_time_is_at_least_a_minute():
+    assert reading_time("") == 1
+    assert reading_time("word " * 401) == 3
+
+
+def test_process_post_stores_sanitized_html_and_plain_text_summary():
+    processed = process_post("<p>Hello <script>x</script><b>reader</b></p>")
+    assert processed["body_html"] == "<p>Hello <b>reader</b></p>"
+    assert processed["excerpt"] == "Hello reader"
+    assert processed["content_version"] == PIPELINE_VERSION
+
+
+@pytest.fixture
+def posts():
+    engine = create_engine("sqlite://")
+    table = Table("posts", MetaData(), Column("id", Integer, primary_key=True), Column("body", Text),
+                  Column("body_html", Text), Column("excerpt", Text), Column("reading_time", Integer),
+                  Column("content_version", Integer))
+    table.create(engine)
+    with engine.begin() as connection:
+        connection.execute(table.insert(), [dict(id=1, body="<p>a</p>", content_version=0),
+                                            dict(id=2, body="<p>b</p>", content_version=0),
+                                            dict(id=3, body="<p>c</p>", content_version=PIPELINE_VERSION),
+                                            dict(id=4, body="<p>d</p>", content_version=0)])
+    with Session(engine) as session:
+        yield table, session
+
+
+def test_reprocess_renders_only_old_rows(posts):
+    table, session = posts
+    progress = []
+    assert reprocess(session, table, "body", process_post, batch_size=2, progress=progress.append) == 3
+    assert progress == [2, 3]
+    rows = session.execute(select(table.c.id, table.c.body_html).order_by(table.c.id)).all()
+    assert rows == [(1, "<p>a</p>"), (2, "<p>b</p>"), (3, None), (4, "<p>d</p>")]
+    assert reprocess(session, table, "body", process_post) == 0
+
+
+def test_reprocess_does_not_count_rows_edited_meanwhile(posts):
+    table, session = posts
+
+    def process(body):
+        if body == "<p>b</p>":  # The post is edited between being read and being rewritten
+            session.execute(table.update().where(table.c.id == 2)
+                            .values(body="<p>edited</p>", body_html="<p>edited</p>", content_version=PIPELINE_VERSION))
+        return process_post(body)
+
+    assert reprocess(session, table, "body", process) == 2
+    assert session.scalar(select(table.c.body_html).where(table.c.id == 2)) == "<p>edited</p>"
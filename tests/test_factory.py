@@ -0,0 +1,37 @@
+from conftest import add_post, add_user, log_in
+
+
+def publish(app, title):
+    client = app.test_client()
+    log_in(client, add_user(app))
+    add_post(client, title)
+    return client
+
+
+def test_apps_have_their_own_extensions(make_app):
+    first, second = make_app("first"), make_app("second")
+    for name in ("outbox", "password_hasher", "rate_limiter", "search_index", "syndication", "page_cache",
+                 "user_cache"):
+        assert first.extensions[name] is not second.extensions[name]
+    assert first.login_manager is not second.login_manager
+
+
+def test_two_apps_do_not_share_pages_or_data(make_app):
+    first, second = make_app("first"), make_app("second")
+    first_client = publish(first, "Only in the first blog")
+    second_client = publish(second, "Only in the second blog")
+    first_home = first_client.get("/").get_data(as_text=True)   # Now held by the first app's page cache
+    assert "Only in the first blog" in first_home
+    assert "Only in the second blog" not in first_home
+    second_home = second_client.get("/").get_data(as_text=True)
+    assert "Only in the second blog" in second_home
+    assert "Only in the first blog" not in second_home
+
+
+def test_rate_limits_are_per_app(make_app):
+    first = make_app("first", RATE_LIMIT_LOGIN="1/hour")
+    second = make_app("second", RATE_LIMIT_LOGIN="1/hour")
+    form = dict(email="nobody@example.com", password="wrong")
+    assert first.test_client().post("/login", data=form).status_code != 429
+    assert second.test_client().post("/login", data=form).status_code != 429
+    assert first.test_client().post("/login", data=form).status_code == 429
@@ -0,0 +1,98 @@
+import re
+import sqlite3
+
+import pytest
+from sqlalchemy import event
+
+import main
+from conftest import add_post, add_user, log_in
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(PAGE_CACHE_MAX_BYTES=0, POSTS_PER_PAGE=3)
+
+
+def count_queries(app, client, path):
+    with app.app_context():
+        engine = main.db.engine
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert client.get(path).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return len(statements)
+
+
+def test_homepage_query_count_does_not_grow_with_posts(app, client, admin):
+    admin("First")
+    one_post = count_queries(app, client, "/")
+    admin("Second")
+    admin("Third")
+    assert count_queries(app, client, "/") == one_post
+
+
+def test_init_db_backfills_author_names(app, tmp_path, admin):
+    admin("First")
+    admin("Second")
+    with sqlite3.connect(tmp_path / "blog.db") as connection:  # As left by a database from before the column
+        connection.execute("ALTER TABLE blog_posts DROP COLUMN author_name")
+    with app.app_context():
+        main.init_db()
+        assert [post.author_name for post in main.BlogPost.query.order_by(main.BlogPost.id)] == ["Admin", "Admin"]
+
+
+def titles_on(page):
+    return re.findall(r'<h2 class="post-title">\s*(.*?)\s*</h2>', page)
+
+
+def test_homepage_pages_through_posts_newest_first(client, admin):
+    for number in range(1, 8):
+        admin(f"Post {number}")
+    pages, path = [], "/"
+    while path:
+        page = client.get(path).get_data(as_text=True)
+        pages.append(titles_on(page))
+        older = re.search(r'href="([^"]*before=\d+)">Older Posts', page)
+        path = older.group(1) if older else None
+    assert pages == [["Post 7", "Post 6", "Post 5"], ["Post 4", "Post 3", "Post 2"], ["Post 1"]]
+
+
+def test_a_full_last_page_has_no_older_link(client, admin):
+    for number in range(1, 4):
+        admin(f"Post {number}")
+    assert "Older Posts" not in client.get("/").get_data(as_text=True)
+
+
+def test_pages_stay_stable_while_posts_are_published(client, admin):
+    for number in range(1, 5):
+        admin(f"Post {number}")
+    first = client.get("/").get_data(as_text=True)
+    admin("Post 5")   # Published while the reader is on the first page
+    older = re.search(r'href="([^"]*before=\d+)">Older Posts', first).group(1)
+    assert titles_on(client.get(older).get_data(as_text=True)) == ["Post 1"]
+
+
+def test_comments_page_through_oldest_first(make_app):
+    app = make_app(COMMENTS_PER_PAGE=2, PAGE_CACHE_MAX_BYTES=0)
+    client = app.test_client()
+    log_in(client, add_user(app))
+    add_post(client, "Talk to me")
+    for number in range(1, 6):
+        client.post("/post/1/comments", data=dict(comment=f"<p>Comment {number}</p>"))
+    seen, after = [], 0
+    while True:
+        listing = client.get(f"/post/1/comments?after={after}").get_json()
+        seen.append([comment["html"] for comment in listing["comments"]])
+        after = listing["cursor"]
+        if not listing["more"]:
+            break
+    assert seen == [["<p>Comment 1</p>", "<p>Comment 2</p>"], ["<p>Comment 3</p>", "<p>Comment 4</p>"],
+                    ["<p>Comment 5</p>"]]
+    page = client.get("/post/1").get_data(as_text=True)
+    assert "Comment 2" in page and "Comment 3" not in page
+    more = re.search(r'href="([^"]*after=\d+)">More Comments', page).group(1)
+    page = client.get(more).get_data(as_text=True)
+    assert "Comment 3" in page and "Comment 4" in page and "Comment 2" not in page
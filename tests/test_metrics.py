@@ -0,0 +1,34 @@
+from flask import g
+from sqlalchemy import text
+
+import main
+from metrics import REQUEST_QUERIES
+
+
+def run_one_query(app):
+    with app.test_request_context("/"):
+        app.preprocess_request()
+        main.db.session.execute(text("SELECT 1"))
+        return g.query_count
+
+
+def test_a_query_is_counted_once_with_several_apps(make_app):
+    first = make_app("first")
+    second = make_app("second")
+    assert run_one_query(first) == 1
+    assert run_one_query(second) == 1
+
+
+def test_each_app_keeps_its_own_sqlite_pragmas(make_app):
+    apps = [make_app("first", SQLITE_SYNCHRONOUS="off"), make_app("second", SQLITE_SYNCHRONOUS="full")]
+    settings = []
+    for app in apps:
+        with app.app_context():
+            main.db.engine.dispose()
+            settings.append(main.db.session.execute(text("PRAGMA synchronous")).scalar())
+    assert settings == [0, 2]
+
+
+def test_requests_record_their_query_count(client):
+    assert client.get("/about").status_code == 200
+    assert any(line.startswith('http_request_db_queries_count{endpoint="about"}') for line in REQUEST_QUERIES.samples())
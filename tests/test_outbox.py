@@ -0,0 +1,89 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from conftest import FakePool
+
+
+@pytest.fixture
+def outbox(app):
+    outbox = app.extensions["outbox"]
+    outbox.pool = FakePool()
+    return outbox
+
+
+def test_contact_messages_are_delivered_over_one_connection(app, client, outbox):
+    for name in ("ada", "grace"):
+        response = client.post("/contact", data=dict(name=name, email=f"{name}@example.com", phone="1",
+                                                     message=f"Hello from {name}"))
+        assert response.status_code == 200
+    assert outbox.pool.sent == []   # Nothing is sent on the request itself
+    with app.app_context():
+        assert outbox.drain() == 2
+        rows = main.OutboxMessage.query.order_by(main.OutboxMessage.id).all()
+        assert [row.status for row in rows] == ["sent", "sent"]
+        assert all(row.sent_at is not None and row.attempts == 1 and row.message == "" for row in rows)
+    assert [sender for sender, _, _ in outbox.pool.sent] == ["blog@example.com"] * 2
+    assert "Hello from ada" in outbox.pool.sent[0][2] and "Hello from grace" in outbox.pool.sent[1][2]
+    assert outbox.pool.connects == 1
+
+
+def test_failed_sends_are_retried_then_given_up(app, outbox):
+    app.config["MAIL_MAX_ATTEMPTS"] = 2
+    outbox.pool.refuse = True
+    with app.app_context():
+        message = outbox.enqueue("blog@example.com", ["someone@example.com"], "Subject: Hi\n\nHello")
+        assert outbox.drain() == 1
+        main.db.session.refresh(message)
+        assert message.status == "pending" and message.attempts == 1
+        assert message.next_attempt_at > datetime.utcnow()
+        assert outbox.drain() == 0  # Not due again until the backoff has passed
+        message.next_attempt_at = datetime.utcnow()
+        main.db.session.commit()
+        assert outbox.drain() == 1
+        main.db.session.refresh(message)
+        assert message.status == "failed" and "SMTPRecipientsRefused" in message.last_error
+    assert outbox.pool.sent == []
+
+
+def test_prune_deletes_only_old_sent_and_failed_messages(app, outbox):
+    old = datetime.utcnow() - timedelta(days=app.config["MAIL_RETENTION_DAYS"] + 1)
+    with app.app_context():
+        for status, sent_at in [("sent", old), ("sent", datetime.utcnow()), ("failed", None), ("pending", None)]:
+            main.db.session.add(main.OutboxMessage(
+                from_addr="blog@example.com", to_addrs=json.dumps(["someone@example.com"]), message="Hi",
+                status=status, attempts=1, next_attempt_at=old, created_at=old, sent_at=sent_at))
+        main.db.session.commit()
+        assert outbox.prune() == 2
+        remaining = main.db.session.execute(main.db.select(main.OutboxMessage.status, main.OutboxMessage.sent_at)
+                                            .order_by(main.OutboxMessage.id)).all()
+        assert [status for status, _ in remaining] == ["sent", "pending"]
+
+
+def test_a_message_that_keeps_killing_its_worker_is_given_up(app, outbox):
+    app.config["MAIL_MAX_ATTEMPTS"] = 2
+    with app.app_context():
+        message = outbox.enqueue("blog@example.com", ["someone@example.com"], "Subject: Hi\n\nHello")
+        for attempt in (1, 2):
+            assert outbox._claim().id == message.id     # The worker dies here, before _deliver() returns
+            message.next_attempt_at = datetime.utcnow()  # ...and its lease runs out
+            main.db.session.commit()
+        assert outbox.drain() == 0
+        main.db.session.refresh(message)
+        assert message.status == "failed" and message.attempts == 2 and message.message == ""
+        assert "worker stopped" in message.last_error
+    assert outbox.pool.sent == []
+
+
+def test_unexpected_send_errors_are_retried_with_backoff(app, outbox, monkeypatch):
+    def crash(*args, **kwargs):
+        raise UnicodeEncodeError("ascii", "é", 0, 1, "ordinal not in range")
+    monkeypatch.setattr(outbox.pool, "_connect", crash)
+    with app.app_context():
+        message = outbox.enqueue("blog@example.com", ["someone@example.com"], "Subject: Hi\n\nHello")
+        assert outbox.drain() == 1
+        main.db.session.refresh(message)
+        assert message.status == "pending" and message.attempts == 1
+        assert message.next_attempt_at > datetime.utcnow() and "UnicodeEncodeError" in message.last_error
@@ -0,0 +1,101 @@
+import time
+from datetime import date, datetime
+
+import pytest
+
+from conftest import add_post, add_user, log_in
+from page_cache import PageCache
+
+
+def test_invalidate_drops_only_entries_with_the_tag():
+    cache = PageCache()
+    cache.set("home", "<p>home</p>", ["feed", "post:1", "post:2"])
+    cache.set("first", "<p>one</p>", ["post:1"])
+    cache.set("second", "<p>two</p>", ["post:2"])
+    cache.invalidate("post:1")
+    assert cache.get("home") is None and cache.get("first") is None
+    assert cache.get("second").body == b"<p>two</p>"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_pages_are_evicted_to_fit():
+    cache = PageCache(max_bytes=1200)  # Room for two of these pages
+    cache.set("a", "x" * 300)
+    cache.set("b", "x" * 300)
+    cache.get("a")
+    cache.set("c", "x" * 300)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_pages_expire_after_the_ttl():
+    cache = PageCache(ttl=0.05)
+    cache.set("a", "page")
+    time.sleep(0.06)
+    assert cache.get("a") is None and len(cache) == 0
+
+
+@pytest.fixture
+def site(app, admin):
+    """Two posts by the admin, a logged-in admin client and an anonymous reader who warmed the cache."""
+    admin("First")
+    admin("Second")
+    reader = app.test_client()
+    now = datetime.now()
+    for path in ("/", "/post/1", "/post/2", "/author/1", f"/archive/{now.year}/{now.month}"):
+        assert reader.get(path).status_code == 200
+    return reader
+
+
+def cached(app):
+    now, today = datetime.now(), date.today()
+    names = {("feed", None): "feed", ("post", 1, None, today): "post 1", ("post", 2, None, today): "post 2",
+             ("author", 1, None): "author", ("archive", now.year, now.month, None): "archive"}
+    return {names[key] for key in app.extensions["page_cache"]._entries}
+
+
+def test_a_repeat_get_revalidates_with_a_304(site):
+    first = site.get("/post/1")
+    assert first.headers["Cache-Control"] == "no-cache"
+    repeat = site.get("/post/1", headers={"If-None-Match": first.headers["ETag"]})
+    assert repeat.status_code == 304 and repeat.data == b""
+    repeat = site.get("/post/1", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert repeat.status_code == 304 and repeat.data == b""
+    assert site.get("/post/1", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_the_warm_cache_holds_every_page(app, site):
+    assert cached(app) == {"feed", "post 1", "post 2", "author", "archive"}
+
+
+def test_a_new_post_drops_the_listings_only(app, client, site):
+    add_post(client, "Third")
+    assert cached(app) == {"post 1", "post 2"}
+    assert "Third" in site.get("/").get_data(as_text=True)
+
+
+def test_an_edit_drops_the_pages_showing_that_post(app, client, site):
+    client.post("/edit-post/1", data=dict(title="First", subtitle="Rewritten subtitle", author="Admin",
+                                          img_url="https://example.com/cover.png", body="<p>New</p>", version=1))
+    assert cached(app) == {"post 2"}
+    assert "Rewritten subtitle" in site.get("/").get_data(as_text=True)
+
+
+def test_a_comment_drops_the_pages_showing_that_post(app, client, site):
+    client.post("/post/1/comments", data=dict(comment="<p>Fresh comment</p>"))
+    assert cached(app) == {"post 2"}
+    assert "Fresh comment" in site.get("/post/1").get_data(as_text=True)
+
+
+def test_a_deletion_drops_the_listings_and_that_post(app, client, site):
+    client.get("/delete/2")
+    assert cached(app) == {"post 1"}
+    assert site.get("/post/2").status_code == 404
+
+
+def test_logged_in_pages_are_never_cached(app, client, site):
+    app.extensions["page_cache"].clear()
+    response = client.get("/post/1")
+    assert response.status_code == 200 and "ETag" not in response.headers
+    assert client.get("/").status_code == 200
+    assert len(app.extensions["page_cache"]) == 0
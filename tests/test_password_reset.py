@@ -0,0 +1,78 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+from conftest import FakePool, add_user
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app(RATE_LIMIT_FORGOT_PASSWORD=0, RATE_LIMIT_LOGIN=0)  # Every test client shares one IP
+    app.extensions["outbox"].pool = FakePool()
+    return app
+
+
+def request_code(app, client, email):
+    """Asks for a reset code for `email`, delivers the queued mail and returns the code it carried."""
+    assert client.post("/forgot_pass", data=dict(email=email)).headers["Location"] == "/verify"
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:  # Another user's drain may be the one delivering this message
+        with app.app_context():
+            app.extensions["outbox"].drain()
+        for _, to_addrs, text in list(app.extensions["outbox"].pool.sent):
+            if email in to_addrs:
+                return re.search(r"'Verify Password' page\.\n\n(\S+)\n", text).group(1)
+        time.sleep(0.01)
+    raise AssertionError(f"No reset email was sent to {email}")
+
+
+def reset_password(app, email, new_password):
+    client = app.test_client()
+    code = request_code(app, client, email)
+    assert client.post("/verify", data=dict(code="not-" + code)).headers["Location"] == "/login"
+    assert client.post("/verify", data=dict(code=code)).headers["Location"] == "/change_pass"
+    response = client.post("/change_pass", data=dict(password=new_password, copy_password=new_password))
+    assert response.headers["Location"] == "/"
+    return code
+
+
+def logs_in(app, email, password):
+    response = app.test_client().post("/login", data=dict(email=email, password=password))
+    return response.headers["Location"] == "/"
+
+
+def test_reset_code_is_not_kept_in_the_outbox(app):
+    add_user(app, email="ada@example.com", password="old-password")
+    code = request_code(app, app.test_client(), "ada@example.com")
+    with app.app_context():
+        bodies = [message.message for message in main.OutboxMessage.query]
+        codes = [reset.code_hash for reset in main.PasswordReset.query]
+    assert bodies == [""]
+    assert code not in "".join(codes)
+
+
+def test_a_code_only_works_in_the_browser_that_asked_for_it(app):
+    add_user(app, email="ada@example.com", password="old-password")
+    code = request_code(app, app.test_client(), "ada@example.com")
+    other_browser = app.test_client()
+    other_browser.post("/verify", data=dict(code=code))
+    response = other_browser.post("/change_pass", data=dict(password="new-password", copy_password="new-password"))
+    assert response.headers["Location"] == "/forgot_pass"
+    assert logs_in(app, "ada@example.com", "old-password")
+
+
+def test_many_users_resetting_at_once_each_get_their_own_password(app):
+    users = [f"user{number}@example.com" for number in range(16)]
+    for email in users:
+        add_user(app, email=email, password="old-password", name=email.partition("@")[0])
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        codes = list(pool.map(lambda email: reset_password(app, email, f"new-password-{email}"), users))
+    assert len(set(codes)) == len(users)
+    for email in users:
+        assert logs_in(app, email, f"new-password-{email}")
+        assert not logs_in(app, email, "old-password")
+    with app.app_context():
+        assert main.PasswordReset.query.filter(main.PasswordReset.used_at.is_(None)).count() == 0
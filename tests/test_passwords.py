@@ -0,0 +1,59 @@
+import pytest
+from flask import Flask
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import main
+from conftest import add_user
+from passwords import PasswordHasher, PasswordHasherBusy
+
+
+def make_hasher(method, salt_length=16):
+    app = Flask(__name__)
+    app.config.update(PASSWORD_HASH_METHOD=method, PASSWORD_SALT_LENGTH=salt_length, PASSWORD_HASH_WORKERS=0)
+    return PasswordHasher(app)
+
+
+@pytest.mark.parametrize("method", ["scrypt", "pbkdf2:sha256", "pbkdf2", "pbkdf2:sha256:1000", "scrypt:16384:8:1"])
+def test_hashes_made_under_the_policy_need_no_rehash(method):
+    hasher = make_hasher(method)
+    stored = hasher.hash("correct horse")
+    assert hasher.verify(stored, "correct horse")
+    assert not hasher.needs_rehash(stored)
+
+
+@pytest.mark.parametrize("stored_method", ["pbkdf2:sha256:1000", "pbkdf2:sha1:600000", "scrypt"])
+def test_hashes_under_another_method_or_cost_need_a_rehash(stored_method):
+    hasher = make_hasher("pbkdf2:sha256:2000")
+    assert hasher.needs_rehash(generate_password_hash("correct horse", stored_method, 16))
+
+
+def test_short_salts_need_a_rehash():
+    hasher = make_hasher("pbkdf2:sha256:1000")
+    assert hasher.needs_rehash(generate_password_hash("correct horse", "pbkdf2:sha256:1000", 8))
+
+
+def test_logging_in_upgrades_an_old_hash(make_app):
+    app = make_app(PASSWORD_HASH_METHOD="pbkdf2:sha256:2000")
+    user_id = add_user(app, email="ada@example.com", password="old-password")   # Hashed with 1000 iterations
+    response = app.test_client().post("/login", data=dict(email="ada@example.com", password="old-password"))
+    assert response.headers["Location"] == "/"
+    with app.app_context():
+        stored = main.db.session.get(main.User, user_id).password
+        assert stored.startswith("pbkdf2:sha256:2000$")
+        assert not app.extensions["password_hasher"].needs_rehash(stored)
+
+
+def test_a_busy_hasher_does_not_fail_a_correct_login(make_app, monkeypatch):
+    app = make_app(PASSWORD_HASH_METHOD="pbkdf2:sha256:2000")
+    user_id = add_user(app, email="ada@example.com", password="old-password")   # Due for an upgrade
+    hasher = app.extensions["password_hasher"]
+
+    def busy(func, *args):
+        if func is not check_password_hash:
+            raise PasswordHasherBusy("Too many password checks are in progress")
+        return func(*args)
+    monkeypatch.setattr(hasher, "_run", busy)
+    response = app.test_client().post("/login", data=dict(email="ada@example.com", password="old-password"))
+    assert response.headers["Location"] == "/"
+    with app.app_context():
+        assert main.db.session.get(main.User, user_id).password.startswith("pbkdf2:sha256:1000$")  # Left for a later login
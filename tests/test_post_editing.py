@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy.orm.exc import StaleDataError
+
+import main
+
+
+def edit(client, body, version):
+    return client.post("/edit-post/1", data=dict(title="Draft", subtitle="About drafts", author="Admin",
+                                                 img_url="https://example.com/cover.png", body=body, version=version))
+
+
+def stored_post(app):
+    with app.app_context():
+        post = main.db.session.get(main.BlogPost, 1)
+        return post.body, post.version
+
+
+@pytest.fixture
+def post(admin):
+    admin("Draft", body="<p>First draft</p>")
+
+
+def test_an_edit_bumps_the_version(app, client, post):
+    assert stored_post(app) == ("<p>First draft</p>", 1)
+    assert edit(client, "<p>Second draft</p>", 1).headers["Location"] == "/post/1"
+    assert stored_post(app) == ("<p>Second draft</p>", 2)
+
+
+def test_an_edit_from_a_stale_form_is_refused(app, client, post):
+    edit(client, "<p>Saved first</p>", 1)
+    response = edit(client, "<p>Saved second</p>", 1)   # Opened before the first save
+    assert response.headers["Location"] == "/edit-post/1"
+    assert stored_post(app) == ("<p>Saved first</p>", 2)
+    assert "changed while you were editing" in client.get("/edit-post/1").get_data(as_text=True)
+
+
+def test_comments_do_not_make_an_open_edit_stale(app, client, post):
+    client.post("/post/1/comments", data=dict(comment="<p>Meanwhile</p>"))
+    assert edit(client, "<p>Second draft</p>", 1).headers["Location"] == "/post/1"
+    assert stored_post(app) == ("<p>Second draft</p>", 2)
+
+
+def test_a_concurrent_update_fails_the_commit(app, post):
+    with app.app_context():
+        post = main.db.session.get(main.BlogPost, 1)
+        with main.db.engine.begin() as other_writer:
+            other_writer.execute(main.BlogPost.__table__.update().values(version=main.BlogPost.version + 1))
+        post.body = "<p>Lost update</p>"
+        with pytest.raises(StaleDataError):
+            main.db.session.commit()
+        main.db.session.rollback()
+    assert stored_post(app) == ("<p>First draft</p>", 2)
@@ -0,0 +1,79 @@
+import pytest
+
+import main
+from conftest import add_user
+from ratelimit import parse_limit
+
+
+def test_parse_limit():
+    assert parse_limit("10/minute") == (10 / 60, 10)
+    assert parse_limit("5/hours") == (5 / 3600, 5)
+    assert parse_limit("0") is None and parse_limit("") is None
+
+
+@pytest.mark.parametrize("value", ["10/min", "ten/minute", "0/hour", "10 per minute"])
+def test_a_mistyped_limit_stops_the_app_from_starting(make_app, value):
+    with pytest.raises(ValueError, match="RATE_LIMIT_LOGIN"):
+        make_app(RATE_LIMIT_LOGIN=value)
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app(RATE_LIMIT_LOGIN="2/hour", RATE_LIMIT_REGISTER="1/hour", RATE_LIMIT_FORGOT_PASSWORD="1/hour")
+    add_user(app, email="ada@example.com", password="secret-password")
+    return app
+
+
+@pytest.fixture
+def hashing(app, monkeypatch):
+    """Records every password hashed or checked."""
+    hasher, calls = app.extensions["password_hasher"], []
+    for name in ("hash", "verify"):
+        original = getattr(hasher, name)
+        monkeypatch.setattr(hasher, name, lambda *args, original=original, name=name: calls.append(name) or original(*args))
+    return calls
+
+
+def test_logins_over_the_limit_get_429_with_retry_after_and_no_hashing(client, hashing):
+    form = dict(email="ada@example.com", password="wrong-password")
+    assert client.post("/login", data=form).status_code == 302
+    assert client.post("/login", data=form).status_code == 302
+    assert hashing == ["verify", "verify"]
+    response = client.post("/login", data=form)
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 1800   # Half an hour refills one of two tokens an hour
+    assert hashing == ["verify", "verify"]
+    assert client.get("/login").status_code == 200   # Only the POSTs are limited
+
+
+def test_registrations_over_the_limit_hash_nothing(client, hashing):
+    for number, expected in ((1, 302), (2, 429)):
+        form = dict(email=f"new{number}@example.com", password="long-password", copy_password="long-password",
+                    name="New")
+        assert client.post("/register", data=form).status_code == expected
+    assert hashing == ["hash"]
+
+
+def test_reset_requests_over_the_limit_queue_no_email(app, client):
+    assert client.post("/forgot_pass", data=dict(email="ada@example.com")).status_code == 302
+    assert client.post("/forgot_pass", data=dict(email="ada@example.com")).status_code == 429
+    with app.app_context():
+        assert main.OutboxMessage.query.count() == 1
+
+
+def test_the_account_bucket_catches_requests_from_many_addresses(client):
+    form = dict(email="ada@example.com", password="wrong-password")
+    for address in ("10.0.0.1", "10.0.0.2"):
+        assert client.post("/login", data=form, environ_base={"REMOTE_ADDR": address}).status_code == 302
+    response = client.post("/login", data=form, environ_base={"REMOTE_ADDR": "10.0.0.3"})
+    assert response.status_code == 429
+
+
+def test_apps_share_counts_through_the_sqlite_storage(make_app, tmp_path):
+    storage = tmp_path / "limits.db"
+    first = make_app("first", RATE_LIMIT_LOGIN="1/hour", RATE_LIMIT_STORAGE=storage)
+    second = make_app("second", RATE_LIMIT_LOGIN="1/hour", RATE_LIMIT_STORAGE=storage)
+    form = dict(email="nobody@example.com", password="wrong-password")
+    assert first.test_client().post("/login", data=form).status_code == 302
+    response = second.test_client().post("/login", data=form)
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) > 0
@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+from conftest import add_post, add_user, log_in
+
+
+@pytest.fixture
+def replicated(make_app, tmp_path):
+    """An app reading from a replica snapshot of its primary in which the post has a different title."""
+    app = make_app("primary", DATABASE_REPLICA_URL=f"sqlite:///{tmp_path / 'replica'}.db",
+                   DATABASE_REPLICA_LAG=60, PAGE_CACHE_MAX_BYTES=0)
+    client = app.test_client()
+    log_in(client, add_user(app))
+    add_post(client, "Primary title")
+    with sqlite3.connect(tmp_path / "primary.db") as primary, sqlite3.connect(tmp_path / "replica.db") as replica:
+        primary.backup(replica)
+        replica.execute("UPDATE blog_posts SET title = 'Replica title'")
+    return app
+
+
+def test_read_only_pages_are_served_from_the_replica(replicated):
+    client = replicated.test_client()
+    assert "Replica title" in client.get("/").get_data(as_text=True)
+    assert "Replica title" in client.get("/post/1").get_data(as_text=True)
+
+
+def test_reads_after_a_write_stick_to_the_primary(replicated):
+    client = replicated.test_client()
+    log_in(client, 1)
+    assert "Replica title" in client.get("/post/1").get_data(as_text=True)
+    assert client.post("/post/1", data=dict(comment="<p>First!</p>")).status_code == 302
+    page = client.get("/post/1").get_data(as_text=True)
+    assert "Primary title" in page and "First!" in page
+    assert "Primary title" in client.get("/").get_data(as_text=True)
+    assert "Replica title" in replicated.test_client().get("/").get_data(as_text=True)  # Other browsers are not pinned
+
+
+def test_writes_never_go_to_the_replica(replicated, tmp_path):
+    client = replicated.test_client()
+    log_in(client, 1)
+    client.post("/post/1", data=dict(comment="<p>Stored once</p>"))
+    with sqlite3.connect(tmp_path / "replica.db") as replica:
+        assert replica.execute("SELECT COUNT(*) FROM comments").fetchone() == (0,)
+    with sqlite3.connect(tmp_path / "primary.db") as primary:
+        assert primary.execute("SELECT COUNT(*) FROM comments").fetchone() == (1,)
@@ -0,0 +1,61 @@
+import pytest
+
+
+def titles(app, query, page=1, per_page=10):
+    with app.app_context():
+        results, has_more = app.extensions["search_index"].search(query, page=page, per_page=per_page)
+    return [result["title"] for result in results], has_more
+
+
+@pytest.fixture
+def garden(admin):
+    admin("Composting basics", body="<p>Start with a bin and patience.</p>")
+    admin("Tomato diary", body="<p>The tomatoes liked the compost we dug in last spring.</p>")
+    admin("Pruning roses", body="<p>Cut above an outward facing bud.</p>")
+
+
+def test_title_matches_rank_above_body_matches(app, garden):
+    assert titles(app, "compost") == (["Composting basics", "Tomato diary"], False)   # Stemmed, title first
+    assert titles(app, "roses bud") == (["Pruning roses"], False)
+
+
+def test_results_are_paged(app, admin):
+    for number in ("one", "two", "three"):
+        admin(f"Seedlings {number}", body="<p>Seedlings need light.</p>")
+    assert titles(app, "seedlings", page=1, per_page=2) == (["Seedlings three", "Seedlings two"], True)
+    assert titles(app, "seedlings", page=2, per_page=2) == (["Seedlings one"], False)
+
+
+def test_the_search_page_highlights_and_pages_results(app, client, admin):
+    app.config["POSTS_PER_PAGE"] = 1
+    admin("Bulbs", body="<p>Plant bulbs before the frost.</p>")
+    admin("Frost", body="<p>Cover the bulbs on cold nights.</p>")
+    html = client.get("/search?q=bulbs").get_data(as_text=True)
+    assert "<mark>bulbs</mark>" in html
+    assert html.count('class="post-preview"') == 1 and "page=2" in html
+    assert client.get("/search?q=bulbs&page=3").status_code == 200
+
+
+@pytest.mark.parametrize("query, expected", [
+    ('"compost AND', ["Composting basics"]),   # Operators and stray quotes are plain words: "and" must match
+    ("compost NOT patience", []),   # Unquoted, NOT would have found the tomato post
+    ('bin"patience', ["Composting basics"]),
+    ("*", []),
+    ("compost*", ["Composting basics", "Tomato diary"]),
+    ("title:roses", []),   # Not a column filter: no post contains the word "title"
+])
+def test_fts_syntax_in_queries_is_matched_literally(app, garden, query, expected):
+    assert titles(app, query) == (expected, False)
+    assert app.test_client().get("/search", query_string={"q": query}).status_code == 200
+
+
+def test_the_index_follows_edits_and_deletes(app, client, garden):
+    response = client.post("/edit-post/2", data=dict(title="Tomato diary", subtitle="About tomatoes", author="Admin",
+                                                     img_url="https://example.com/cover.png",
+                                                     body="<p>Mulch kept the beds moist.</p>", version=1))
+    assert response.status_code == 302
+    assert titles(app, "compost") == (["Composting basics"], False)
+    assert titles(app, "mulch") == (["Tomato diary"], False)
+    client.get("/delete/1")
+    assert titles(app, "compost") == ([], False)
+    assert titles(app, "patience") == ([], False)
@@ -0,0 +1,88 @@
+import hashlib
+
+import pytest
+
+import main
+import conftest
+from conftest import add_user
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app(SESSION_STORE="database")
+    add_user(app, email="admin@example.com", password="secret-password")
+    return app
+
+
+def log_in(client):
+    response = client.post("/login", data=dict(email="admin@example.com", password="secret-password"))
+    assert response.status_code == 302 and response.headers["Location"] != "/login"
+
+
+def stored_ids(app):
+    with app.app_context():
+        return {row.id for row in main.SessionRecord.query}
+
+
+def key(sid):
+    return hashlib.sha256(sid.encode("utf-8")).hexdigest()
+
+
+def test_anonymous_pages_set_no_session(app, client):
+    author = app.test_client()
+    log_in(author)
+    author.post("/new-post", data=dict(title="Public", subtitle="For everyone", author="Admin", body="<p>Hi</p>",
+                                       img_url="https://example.com/cover.png"))
+    ids_before = stored_ids(app)
+    app.config["WTF_CSRF_ENABLED"] = True  # A CSRF token in a rendered form would start a session
+    for path in ("/", "/post/1", "/post/1", "/about", "/"):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert "Set-Cookie" not in response.headers, path
+    assert stored_ids(app) == ids_before
+
+
+def test_logging_in_issues_a_new_session_id(app):
+    attacker = app.test_client()
+    attacker.get("/login?next=/about")  # Anything that starts a session hands out an id
+    planted = attacker.get_cookie("session").value
+    assert stored_ids(app) == {key(planted)}
+
+    victim = app.test_client()
+    victim.set_cookie("session", planted)
+    log_in(victim)
+    issued = victim.get_cookie("session").value
+    assert issued != planted
+    assert stored_ids(app) == {key(issued)}
+    assert victim.get("/new-post").status_code == 200
+    assert attacker.get("/new-post").status_code == 302   # Still anonymous: sent to the login page
+
+
+def test_logging_out_retires_the_session_id(app, client):
+    log_in(client)
+    logged_in = client.get_cookie("session").value
+    client.get("/logout")
+    assert key(logged_in) not in stored_ids(app)
+    replay = app.test_client()
+    replay.set_cookie("session", logged_in)
+    assert replay.get("/new-post").status_code == 302
+
+
+def test_sessions_survive_between_requests(app, client):
+    log_in(client)
+    sid = client.get_cookie("session").value
+    assert client.get("/new-post").status_code == 200
+    assert client.get("/new-post").status_code == 200
+    assert client.get_cookie("session").value == sid
+
+
+def test_anonymous_pages_set_no_cookie_with_the_cookie_store(make_app):
+    app = make_app("cookies")
+    author = app.test_client()
+    conftest.log_in(author, add_user(app))
+    conftest.add_post(author, "Public")
+    app.config["WTF_CSRF_ENABLED"] = True
+    client = app.test_client()
+    for path in ("/", "/post/1", "/post/1"):
+        response = client.get(path)
+        assert response.status_code == 200 and "Set-Cookie" not in response.headers, path
@@ -0,0 +1,38 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from syndication import _atom_time
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    """Runs the test with the server clock in New York, five hours behind UTC in winter."""
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_local_times_are_converted_to_utc(new_york):
+    assert _atom_time(datetime(2024, 1, 15, 20, 30)) == "2024-01-16T01:30:00Z"
+
+
+def test_aware_times_keep_their_instant(new_york):
+    assert _atom_time(datetime(2024, 1, 15, 20, 30, tzinfo=timezone.utc)) == "2024-01-15T20:30:00Z"
+
+
+def test_missing_times_fall_back_to_the_epoch():
+    assert _atom_time(None) == "1970-01-01T00:00:00Z"
+
+
+def test_feed_lists_new_posts(client, admin):
+    admin("Hello feed")
+    response = client.get("/feed.xml")
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert "<title>Hello feed</title>" in body and "<name>Admin</name>" in body
+    assert client.get("/feed.xml", headers={"If-Modified-Since": response.headers["Last-Modified"]}).status_code == 304
+    assert "/post/1</loc>" in client.get("/sitemap.xml").get_data(as_text=True)
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert, select
+
+import main
+from conftest import add_user
+from timestamps import POST_DATE_FORMAT, migrate_timestamps
+
+POSTS = main.BlogPost.__table__
+COMMENTS = main.Comment.__table__
+POST_CONVERSIONS = {"published_at": ("date", POST_DATE_FORMAT), "edited_at": ("last_edit", POST_DATE_FORMAT)}
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def legacy_app(app):
+    """An app whose rows only carry the old text dates, as written before the typed columns existed."""
+    user_id = add_user(app)
+    with app.app_context():
+        main.db.session.execute(insert(POSTS), [
+            dict(title=f"Post {number}", subtitle="", body="<p>Hi</p>", img_url="", author_id=user_id,
+                 date=text, last_edit=edited)
+            for number, (text, edited) in enumerate([("May 03, 2023", "June 10, 2023"),
+                                                     ("May  4,   2023", None),      # Hand-edited spacing
+                                                     ("someday", None),
+                                                     ("July 01, 2023", None)], start=1)])
+        main.db.session.execute(insert(COMMENTS), [
+            dict(commenter_id=user_id, post_comment_id=1, text="Hi", image_url="", date_time=text)
+            for text in ("14:05  .  03 May 2023", "yesterday-ish")])
+        main.db.session.commit()
+    return app
+
+
+def column(app, table, name):
+    with app.app_context():
+        return main.db.session.scalars(select(table.c[name]).order_by(table.c.id)).all()
+
+
+def test_command_fills_typed_columns_and_counts_unreadable_rows(legacy_app):
+    result = legacy_app.test_cli_runner().invoke(args=["migrate-timestamps", "--batch-size", "2"])
+    assert result.exit_code == 0, result.output
+    assert "blog_posts: finished with 3 rows converted and 1 left unreadable." in result.output
+    assert "comments: finished with 1 rows converted and 1 left unreadable." in result.output
+    assert column(legacy_app, POSTS, "published_at") == [
+        datetime(2023, 5, 3), datetime(2023, 5, 4), None, datetime(2023, 7, 1)]
+    assert column(legacy_app, POSTS, "edited_at") == [datetime(2023, 6, 10), None, None, None]
+    assert column(legacy_app, COMMENTS, "created_at") == [datetime(2023, 5, 3, 14, 5), None]
+
+
+def test_an_interrupted_run_resumes_with_the_rows_left(legacy_app):
+    def stop(converted, skipped):
+        raise Interrupted
+
+    with legacy_app.app_context():
+        session = main.db.session
+        with pytest.raises(Interrupted):
+            migrate_timestamps(session, POSTS, POST_CONVERSIONS, batch_size=2, progress=stop)
+        assert column(legacy_app, POSTS, "published_at")[:2] == [datetime(2023, 5, 3), datetime(2023, 5, 4)]
+        # Marks a converted row so a second pass over it would show
+        session.execute(POSTS.update().where(POSTS.c.id == 1).values(published_at=datetime(2000, 1, 1)))
+        session.commit()
+        assert migrate_timestamps(session, POSTS, POST_CONVERSIONS, batch_size=2) == (1, 1)
+    assert column(legacy_app, POSTS, "published_at") == [
+        datetime(2000, 1, 1), datetime(2023, 5, 4), None, datetime(2023, 7, 1)]
@@ -0,0 +1,73 @@
+import re
+
+import pytest
+from sqlalchemy import event, text
+
+import main
+from conftest import FakePool, add_user, log_in
+from test_password_reset import reset_password
+
+
+def user_queries(app, client, path):
+    """Requests `path` and returns how many statements read the user table."""
+    with app.app_context():
+        engine = main.db.engine
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert client.get(path).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return sum(1 for statement in statements if re.search(r'\bFROM "?user"?\b', statement))
+
+
+def test_repeat_requests_are_served_from_the_cache(app, client):
+    log_in(client, add_user(app))
+    assert user_queries(app, client, "/about") == 1
+    assert user_queries(app, client, "/about") == 0
+    assert user_queries(app, client, "/") == 0
+
+
+def test_registering_under_a_reused_id_drops_the_stale_entry(app, client):
+    add_user(app)
+    log_in(client, add_user(app, email="gone@example.com", name="Gone"))
+    client.get("/about")    # Caches user 2
+    with app.app_context():
+        main.db.session.execute(text('DELETE FROM "user" WHERE id = 2'))
+        main.db.session.commit()
+    newcomer = app.test_client()
+    response = newcomer.post("/register", data=dict(name="ada", email="ada@example.com", password="correct horse",
+                                                    copy_password="correct horse"))
+    assert response.status_code == 302
+    with app.app_context():
+        assert main.User.query.filter_by(email="ada@example.com").one().id == 2
+    assert 2 not in app.extensions["user_cache"]._entries
+    newcomer.get("/about")
+    assert app.extensions["user_cache"]._entries[2].name == "Ada"
+
+
+def test_a_password_reset_drops_the_entry(make_app):
+    app = make_app(RATE_LIMIT_FORGOT_PASSWORD=0, RATE_LIMIT_LOGIN=0)
+    app.extensions["outbox"].pool = FakePool()
+    user_id = add_user(app, email="ada@example.com")
+    client = app.test_client()
+    log_in(client, user_id)
+    client.get("/about")
+    assert user_id in app.extensions["user_cache"]._entries
+    reset_password(app, "ada@example.com", "a brand new password")
+    assert user_id not in app.extensions["user_cache"]._entries
+
+
+def test_hits_and_misses_are_exported(app, client):
+    log_in(client, add_user(app))
+
+    def sample(metrics, result):
+        return float(re.search(r'^user_cache_requests\{result="%s"\} (\S+)$' % result, metrics, re.M).group(1))
+
+    first = client.get("/metrics").get_data(as_text=True)
+    client.get("/about")
+    second = client.get("/metrics").get_data(as_text=True)
+    assert sample(first, "miss") == 1 and sample(first, "hit") == 0
+    assert sample(second, "miss") == 1 and sample(second, "hit") == 2     # /about and the second /metrics
+    assert re.search(r"^user_cache_entries 1(\.0)?$", second, re.M)
@@ -0,0 +1,86 @@
+import time
+from datetime import date, datetime
+from functools import lru_cache
+
+from sqlalchemy import bindparam, select
+
+# Formats the legacy text columns were written in; also how the typed columns are displayed
+POST_DATE_FORMAT = "%B %d, %Y"
+COMMENT_TIME_FORMAT = "%H:%M  .  %d %b %Y"
+
+
+@lru_cache(maxsize=4096)
+def _format_post_date(value):
+    return value.strftime(POST_DATE_FORMAT)
+
+
+@lru_cache(maxsize=4096)
+def _format_comment_time(value, today):
+    return value.strftime("%H:%M" if value.date() == today else COMMENT_TIME_FORMAT)
+
+
+def post_date(value, fallback=""):
+    """Template filter formatting a post timestamp, or showing `fallback` for rows not migrated yet."""
+    if value is None:
+        return fallback or ""
+    return _format_post_date(value)
+
+
+def comment_time(value, fallback=""):
+    """Template filter showing only the time for comments made today and the full date otherwise."""
+    if value is None:
+        return fallback or ""
+    return _format_comment_time(value, date.today())
+
+
+def parse_legacy(text, fmt):
+    """Parses a value of one of the old text date columns, or returns None if it is empty or malformed."""
+    if not text:
+        return None
+    try:
+        # Runs of spaces are collapsed so hand-edited rows still parse
+        return datetime.strptime(" ".join(text.split()), " ".join(fmt.split()))
+    except ValueError:
+        return None
+
+
+def migrate_timestamps(session, table, conversions, batch_size=1000, pause=0.0, progress=None):
+    """Fills typed timestamp columns of `table` from their legacy text columns, one short transaction per batch.
+
+    `conversions` maps each new column name to (legacy column name, format); the first new column marks
+    whether a row is done, so an interrupted run simply resumes with the rows still NULL. Rows are walked in
+    primary key order and each batch is written with a single executemany UPDATE, so no lock is held for
+    longer than one batch. Returns the number of rows converted and the number whose text could not be parsed.
+    """
+    columns = list(conversions)
+    marker = table.c[columns[0]]
+    legacy = [table.c[source] for source, _ in conversions.values()]
+    statement = (table.update()
+                 .where(table.c.id == bindparam("row_id"), marker.is_(None))
+                 .values({name: bindparam(f"new_{name}") for name in columns}))
+    last_id, converted, skipped = 0, 0, 0
+    while True:
+        rows = session.execute(
+            select(table.c.id, *legacy)
+            .where(marker.is_(None), table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)).all()
+        if not rows:
+            return converted, skipped
+        params = []
+        for row in rows:
+            values = {f"new_{name}": parse_legacy(row[index + 1], fmt)
+                      for index, (name, (_, fmt)) in enumerate(conversions.items())}
+            if values[f"new_{columns[0]}"] is None:
+                skipped += 1  # Left NULL; templates keep showing the legacy text
+                continue
+            params.append(dict(values, row_id=row.id))
+        if params:
+            session.execute(statement, params)
+        session.commit()
+        last_id = rows[-1].id
+        converted += len(params)
+        if progress is not None:
+            progress(converted, skipped)
+        if pause:
+            time.sleep(pause)  # Leaves room for live traffic between batches
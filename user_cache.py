@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+
+class UserSnapshot(UserMixin):
+    """A detached, read-only copy of the user columns pages need, served as current_user."""
+
+    __slots__ = ("id", "name", "email", "avatar", "is_admin", "expires_at")
+
+    def __init__(self, id, name, email, avatar, ttl=0):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.avatar = avatar
+        self.is_admin = id == 1     # The first registered user is the admin
+        self.expires_at = time.monotonic() + ttl
+
+    @classmethod
+    def from_user(cls, user, ttl=0):
+        return cls(user.id, user.name, user.email, user.avatar, ttl)
+
+    def __repr__(self):
+        return "<User %r>" % self.name
+
+
+class UserCache:
+    """An in-process LRU cache of user snapshots keyed by user id.
+
+    Routes that change a user call invalidate() so this process reloads the row on its next request;
+    other processes pick the change up when their entry reaches `ttl`. A snapshot leaves out the password
+    hash, so the most a stale one can show is an old name or avatar, and logins always read the row.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        app.config.setdefault("USER_CACHE_SIZE", 10000)
+        app.config.setdefault("USER_CACHE_TTL", 60)
+        self.max_entries = app.config["USER_CACHE_SIZE"]
+        self.ttl = app.config["USER_CACHE_TTL"]
+        app.extensions["user_cache"] = self
+
+    def get(self, user_id):
+        with self._lock:
+            snapshot = self._entries.get(user_id)
+            if snapshot is not None and snapshot.expires_at <= time.monotonic():
+                del self._entries[user_id]
+                snapshot = None
+            if snapshot is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return snapshot
+
+    def set(self, user):
+        """Caches a snapshot of the `user` row and returns it."""
+        snapshot = UserSnapshot.from_user(user, self.ttl)
+        if self.max_entries <= 0:
+            return snapshot
+        with self._lock:
+            self._entries[snapshot.id] = snapshot
+            self._entries.move_to_end(snapshot.id)
+            while len(self._entries) > self.max_entries:  # Evict the least recently used users
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)